@@ -1,22 +1,262 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, stream_with_context, g
 import os
 from dotenv import load_dotenv
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from pymongo import MongoClient
+from werkzeug.datastructures import MultiDict
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from pymongo import MongoClient, IndexModel, ASCENDING, InsertOne, UpdateOne, DeleteOne, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout, OperationFailure
 from bson.objectid import ObjectId
+import bson
+import pymongo
+from calendar import monthrange
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
 import re
+import unicodedata
+import click
+import hashlib
+import hmac
+import random
+import csv
+import io
+import itertools
+import json
+import gzip
+import orjson
+import time
+import threading
+import importlib
+import bisect
+from collections import OrderedDict
+from functools import wraps, partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import ContextVar, copy_context
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 load_dotenv()
 
+# Serverless instances (Vercel sets VERCEL=1) pay the whole import on every cold
+# start, so the Mongo client, startup checks and heavy imports wait for first use.
+SERVERLESS = os.getenv("SERVERLESS", "1" if os.getenv("VERCEL") else "0") == "1"
+
+def lazy_import(module, attr=None):
+    loaded = []
+    def load():
+        if not loaded:
+            value = importlib.import_module(module)
+            loaded.append(getattr(value, attr) if attr else value)
+        return loaded[0]
+    return LocalProxy(load)
+
+relativedelta = lazy_import("dateutil.relativedelta", "relativedelta")
+
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson encodes datetimes (ISO 8601) and numpy arrays natively; ObjectIds
+    # and the rest of Flask's extras go through `default`.
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, ObjectId): return str(value)
+        return DefaultJSONProvider.default(value)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self.options), mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.getenv("SECRET_KEY", "dev_key_mongo")
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=6)
+# Proxies in front of the app (Vercel's edge is one) that set X-Forwarded-For; login throttling keys on the client address.
+PROXY_HOPS = int(os.getenv("PROXY_HOPS", 1 if os.getenv("VERCEL") else 0))
+if PROXY_HOPS: app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+# Share of replies re-encoded to measure their size; sampled sizes are scaled up.
+DB_BYTES_SAMPLE_RATE = float(os.getenv("DB_BYTES_SAMPLE_RATE", 0.01))
+# /metrics answers only to `Authorization: Bearer <METRICS_TOKEN>` and is off when unset.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, counts in sorted(self.series.items()):
+                labels = "".join(f'{k}="{v}",' for k, v in key)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {counts[-1]}")
+                lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+request_seconds = Histogram("finscope_request_duration_seconds", "Request latency by route.", LATENCY_BUCKETS)
+request_queries = Histogram("finscope_request_queries", "MongoDB commands issued per request.", (0, 1, 2, 3, 5, 8, 13, 21, 34, 55))
+request_db_bytes = Histogram("finscope_request_db_bytes", "Reply bytes read from MongoDB per request, estimated from sampled replies.", (1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+command_seconds = Histogram("finscope_mongo_command_duration_seconds", "MongoDB command latency by command.", LATENCY_BUCKETS)
+pool_wait_seconds = Histogram("finscope_mongo_pool_wait_seconds", "Time spent waiting for a pooled connection.", (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+password_hash_seconds = Histogram("finscope_password_hash_duration_seconds", "Password hash and verify latency by operation.", (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+METRICS = (request_seconds, request_queries, request_db_bytes, command_seconds, pool_wait_seconds, password_hash_seconds)
+
+class RequestStats:
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.documents = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds, documents, size):
+        with self.lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            self.documents += documents
+            self.bytes += size
+
+# Set per request; run_concurrently copies it into the query pool's threads.
+request_stats = ContextVar("request_stats", default=None)
+# A list while check-indexes replays a route: read commands are collected for explain.
+command_capture = ContextVar("command_capture", default=None)
+
+def query_shape(value, depth=0):
+    # Keeps operators and field names, masks every literal.
+    if depth > 6: return "..."
+    if isinstance(value, dict): return {k: query_shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(v, (dict, list)) for v in value): return [query_shape(v, depth + 1) for v in value[:20]]
+        return ["?"]
+    return "?"
+
+class CommandMetrics(monitoring.CommandListener):
+    SHAPE_FIELDS = ("filter", "pipeline", "sort", "projection", "updates", "deletes", "query")
+    READ_COMMANDS = ("find", "aggregate", "count", "distinct")
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        self.pending[(event.connection_id, event.request_id)] = event.command
+        captured = command_capture.get()
+        if captured is not None and event.command_name in self.READ_COMMANDS: captured.append(event.command)
+
+    def succeeded(self, event):
+        cursor = event.reply.get('cursor') or {}
+        documents = len(cursor.get('firstBatch', cursor.get('nextBatch', ()))) or event.reply.get('n', 0)
+        # Re-encoding a reply costs about as much as decoding it, so only a sample is measured.
+        size = len(bson.encode(event.reply)) / DB_BYTES_SAMPLE_RATE if random.random() < DB_BYTES_SAMPLE_RATE else 0
+        self.record(event, documents, size)
+
+    def failed(self, event):
+        self.record(event, 0, 0)
+
+    def record(self, event, documents, size):
+        command = self.pending.pop((event.connection_id, event.request_id), None)
+        seconds = event.duration_micros / 1e6
+        command_seconds.observe(seconds, command=event.command_name)
+        stats = request_stats.get()
+        if stats: stats.add(seconds, documents, size)
+        if seconds * 1000 >= SLOW_QUERY_MS and command is not None:
+            shape = {k: query_shape(command[k]) for k in self.SHAPE_FIELDS if k in command}
+            app.logger.warning("Slow query %.1fms on %s: %s %s.%s %s", seconds * 1000, stats.route if stats else "-",
+                               event.command_name, event.database_name, command.get(event.command_name), json.dumps(shape))
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.local = threading.local()
+        self.checked_out = 0
+        self.lock = threading.Lock()
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self.observe_wait()
+        with self.lock: self.checked_out += 1
+
+    def connection_check_out_failed(self, event):
+        self.observe_wait()
+
+    def connection_checked_in(self, event):
+        with self.lock: self.checked_out -= 1
+
+    def observe_wait(self):
+        started = getattr(self.local, 'started', None)
+        if started is not None: pool_wait_seconds.observe(time.perf_counter() - started)
+        self.local.started = None
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+
+pool_metrics = PoolMetrics()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/finscope")
+mongo_lock = threading.Lock()
+mongo = {}
+
+def mongo_options():
+    options = {"event_listeners": [CommandMetrics(), pool_metrics]}
+    if SERVERLESS:
+        # An instance serves one request at a time and may be frozen between them:
+        # a few sockets, none kept open idle, and fast failure instead of a 30s hang.
+        options.update(
+            maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 5)),
+            minPoolSize=0,
+            maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+            serverSelectionTimeoutMS=int(os.getenv("MONGO_SELECTION_TIMEOUT_MS", 5000)),
+            connectTimeoutMS=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+        )
+    return options
+
+def get_client():
+    # Created once per process on first use and reused by every warm invocation.
+    if "client" not in mongo:
+        with mongo_lock:
+            if "client" not in mongo:
+                new_client = MongoClient(MONGO_URI, **mongo_options())
+                mongo["db"] = new_client.get_database()
+                mongo["client"] = new_client
+    return mongo["client"]
 
-client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/finscope"))
-db = client.get_database()
+def get_db():
+    get_client()
+    return mongo["db"]
+
+client = LocalProxy(get_client)
+db = LocalProxy(get_db)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -29,42 +269,1174 @@ CATEGORY_COLORS = [
     "#c0392b", "#bdc3c7", "#7f8c8d"
 ]
 
+DATED_COLLECTIONS = ("incomes", "expenses", "macro_expenses", "investment_entries")
+
+INDEXES = {
+    "users": [IndexModel([("username", ASCENDING)], unique=True)],
+    "user_settings": [IndexModel([("user_id", ASCENDING)])],
+    "wallets": [IndexModel([("user_id", ASCENDING)])],
+    "goals": [IndexModel([("user_id", ASCENDING)])],
+    "credit_cards": [IndexModel([("user_id", ASCENDING)])],
+    "investments": [IndexModel([("user_id", ASCENDING)])],
+    "incomes": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("content_hash", ASCENDING)], unique=True, partialFilterExpression={"content_hash": {"$exists": True}})
+    ],
+    "expenses": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("card_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("search_tokens", ASCENDING)]),
+        IndexModel([("plan_id", ASCENDING), ("installment_index", ASCENDING)], unique=True, partialFilterExpression={"plan_id": {"$exists": True}}),
+        IndexModel([("user_id", ASCENDING), ("content_hash", ASCENDING)], unique=True, partialFilterExpression={"content_hash": {"$exists": True}})
+    ],
+    "macro_expenses": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("card_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("content_hash", ASCENDING)], unique=True, partialFilterExpression={"content_hash": {"$exists": True}})
+    ],
+    "investment_entries": [
+        IndexModel([("investment_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)])
+    ],
+    "installment_plans": [
+        IndexModel([("user_id", ASCENDING), ("schedule", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("card_id", ASCENDING), ("schedule", ASCENDING)])
+    ],
+    "monthly_rollups": [
+        IndexModel([("user_id", ASCENDING), ("month", ASCENDING), ("kind", ASCENDING), ("category", ASCENDING)], unique=True)
+    ],
+    "card_statements": [
+        IndexModel([("user_id", ASCENDING), ("card_id", ASCENDING), ("month", ASCENDING)], unique=True)
+    ]
+}
+
+# Indexes superseded by a wider one in INDEXES; dropped on startup.
+OBSOLETE_INDEXES = {
+    "incomes": ["user_id_1_date_1"],
+    "expenses": ["user_id_1_date_1"],
+    "macro_expenses": ["user_id_1_date_1"]
+}
+
+# Date expression used by aggregations: prefers the stored BSON date and only
+# parses the string for documents the migration has not reached yet.
+DATE_EXPR = {"$ifNull": ["$date_dt", {"$toDate": "$date"}]}
+
+# Investment entries live in a time-series collection (MongoDB 6.0+, which also
+# allows the secondary indexes below); older servers keep a regular collection.
+TIME_SERIES = {
+    "investment_entries": {"timeField": "date_dt", "metaField": "investment_id", "granularity": "hours"}
+}
+
+def is_time_series(coll_name):
+    info = next(db.list_collections(filter={"name": coll_name}), None)
+    return bool(info and info.get('type') == 'timeseries')
+
+def ensure_time_series():
+    existing = set(db.list_collection_names())
+    if client.server_info().get('versionArray', [0])[0] < 6: return
+    for coll_name, options in TIME_SERIES.items():
+        if coll_name not in existing: db.create_collection(coll_name, timeseries=options)
+
+class TransactionsUnavailable(Exception):
+    pass
+
+def run_transaction(callback):
+    # callback(session) runs in a transaction. A standalone server rejects
+    # transactions (IllegalOperation) before any write, so nothing was applied.
+    with client.start_session() as session:
+        try:
+            return session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code == 20: raise TransactionsUnavailable(str(e))
+            raise
+
+def ensure_indexes():
+    ensure_time_series()
+    for coll_name, models in INDEXES.items():
+        db[coll_name].create_indexes(models)
+    for coll_name, names in OBSOLETE_INDEXES.items():
+        existing = db[coll_name].index_information()
+        for name in names:
+            if name in existing: db[coll_name].drop_index(name)
+
+def to_date(date_str):
+    return datetime.strptime(date_str[:10], '%Y-%m-%d')
+
+def migrate_date_fields():
+    updated = {}
+    for coll_name in DATED_COLLECTIONS:
+        if is_time_series(coll_name): continue
+        res = db[coll_name].update_many(
+            {"date_dt": {"$exists": False}, "date": {"$type": "string"}},
+            [{"$set": {"date_dt": {"$dateFromString": {
+                "dateString": {"$substr": ["$date", 0, 10]},
+                "format": "%Y-%m-%d",
+                "onError": None
+            }}}}]
+        )
+        updated[coll_name] = res.modified_count
+    return updated
+
+SEARCH_FIELDS = ("description", "establishment", "category", "buyer")
+SEARCH_LIMIT = 200
+SEARCH_TOKEN_RE = re.compile(r'\w+')
+
+def search_tokens(*values):
+    # Accent-folded, lower-cased words; stored on expenses and matched by prefix.
+    text = " ".join(str(v) for v in values if v)
+    text = "".join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return sorted(set(SEARCH_TOKEN_RE.findall(text.lower())))
+
+def build_search_index(rebuild=False, batch_size=1000):
+    query = {} if rebuild else {"search_tokens": {"$exists": False}}
+    projection = {f: 1 for f in SEARCH_FIELDS}
+    updated, ops = 0, []
+    for doc in db.expenses.find(query, projection).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": doc['_id']}, {"$set": {"search_tokens": search_tokens(*(doc.get(f) for f in SEARCH_FIELDS))}}))
+        if len(ops) == batch_size:
+            updated += db.expenses.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops: updated += db.expenses.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+def _winning_plans(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'winningPlan': yield value
+            else: yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for value in node: yield from _winning_plans(value)
+
+def _has_collscan(node):
+    if isinstance(node, dict):
+        if node.get('stage') == 'COLLSCAN': return True
+        return any(_has_collscan(v) for v in node.values())
+    if isinstance(node, list):
+        return any(_has_collscan(v) for v in node)
+    return False
+
+# GET routes check-indexes replays; ids and dates are filled in per probe user.
+PLAN_PROBES = (
+    "/api/settings", "/api/years", "/api/balance", "/api/wallets", "/api/cards", "/api/goals", "/api/investments",
+    "/api/cards/invoices?from={month}&to={month}", "/api/cards/{card_id}/invoice?month={month}",
+    "/api/incomes?start_date={start}&end_date={end}", "/api/macro-expenses?start_date={start}&end_date={end}",
+    "/api/expenses?start_date={start}&end_date={end}", "/api/expenses?search=probe",
+    "/api/transactions?date={month}", "/api/transactions?scope=micro&after={end},{probe_id}",
+    "/api/dashboard?period=all", "/api/dashboard?period=30&granularity=day",
+    "/api/dashboard?period=year&year={year}&granularity=day&view_mode=category",
+    "/api/investments/history", "/api/investments/series?resolution=week", "/api/investments/{investment_id}/entries",
+    "/api/forecast?months=12", "/api/bootstrap"
+)
+EXPLAIN_DROP = ("lsid", "txnNumber", "startTransaction", "autocommit", "readConcern", "writeConcern", "apiVersion")
+
+def explain_command(command):
+    # The command as the route sent it, minus session and transport fields.
+    return {k: v for k, v in command.items() if not k.startswith('$') and k not in EXPLAIN_DROP}
+
+def check_query_plans(user_id=None):
+    # Replays the read routes as `user_id` (or a user with no data) and explains every
+    # find/aggregate/count they sent, $unionWith branches and facets included.
+    user_doc = db.users.find_one({"_id": user_id}) if user_id else None
+    user = User(user_doc or {"_id": ObjectId(), "username": "probe", "password_hash": ""})
+    uid = ObjectId(user.id)
+    card = db.credit_cards.find_one({"user_id": uid}, {"_id": 1})
+    investment = db.investments.find_one({"user_id": uid}, {"_id": 1})
+    today = datetime.now()
+    fields = {
+        "month": today.strftime('%Y-%m'), "start": today.strftime('%Y-%m-01'), "end": today.strftime('%Y-%m-%d'),
+        "year": today.year, "probe_id": ObjectId(),
+        "card_id": card['_id'] if card else ObjectId(), "investment_id": investment['_id'] if investment else ObjectId()
+    }
+
+    failures = [("login/register", "users", {"username": "?"})] if any(
+        _has_collscan(p) for p in _winning_plans(db.users.find({"username": "probe"}).explain())) else []
+    for probe in PLAN_PROBES:
+        path = probe.format(**fields)
+        captured = []
+        token = command_capture.set(captured)
+        try:
+            with app.test_request_context(path):
+                login_user(user)
+                response = app.full_dispatch_request()
+        finally:
+            command_capture.reset(token)
+        if response.status_code >= 500: raise RuntimeError(f"{path} answered {response.status_code}")
+        for command in captured:
+            plan = db.command("explain", explain_command(command), verbosity="queryPlanner")
+            if any(_has_collscan(p) for p in _winning_plans(plan)):
+                name = next(iter(command))
+                failures.append((path, command[name], query_shape({k: command[k] for k in CommandMetrics.SHAPE_FIELDS if k in command})))
+    return failures
+
+# kind -> (source collection, category expression)
+ROLLUP_SOURCES = {
+    "income": ("incomes", {"$literal": "Income"}),
+    "expense": ("macro_expenses", {"$ifNull": ["$category", "Others"]}),
+    "investment": ("investment_entries", "$type")
+}
+
+ROLLUP_KINDS = {"incomes": "income", "macro_expenses": "expense"}
+
+def rollup_category(kind, doc):
+    if kind == 'income': return "Income"
+    if kind == 'investment': return doc.get('type')
+    category = doc.get('category')
+    return "Others" if category is None else category
+
+def apply_rollup_deltas(kind, removed=(), added=()):
+    deltas = {}
+    for sign, docs in ((-1, removed), (1, added)):
+        for doc in docs:
+            if not doc: continue
+            key = (doc['user_id'], doc['date'][:7], rollup_category(kind, doc))
+            total, count = deltas.get(key, (0, 0))
+            deltas[key] = (total + sign * float(doc['amount']), count + sign)
+
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "month": month, "kind": kind, "category": category},
+            {"$inc": {"total": total, "count": count}},
+            upsert=True
+        )
+        for (user_id, month, category), (total, count) in deltas.items() if count or total
+    ]
+    if ops: db.monthly_rollups.bulk_write(ops, ordered=False)
+
+def rollup_pipeline(kind, user_id=None):
+    coll_name, category = ROLLUP_SOURCES[kind]
+    return coll_name, [
+        {"$match": {"user_id": user_id} if user_id else {}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "month": {"$substr": ["$date", 0, 7]}, "category": category},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "month": "$_id.month",
+            "kind": {"$literal": kind},
+            "category": "$_id.category",
+            "total": 1,
+            "count": 1
+        }}
+    ]
+
+def rebuild_rollups(user_id=None):
+    db.monthly_rollups.delete_many({"user_id": user_id} if user_id else {})
+    for kind in ROLLUP_SOURCES:
+        coll_name, pipeline = rollup_pipeline(kind, user_id)
+        db[coll_name].aggregate(pipeline + [{"$merge": {
+            "into": "monthly_rollups",
+            "on": ["user_id", "month", "kind", "category"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}])
+
+def check_rollups(user_id=None):
+    def key(row): return (row['user_id'], row['month'], row['kind'], row['category'])
+
+    expected = {}
+    for kind in ROLLUP_SOURCES:
+        coll_name, pipeline = rollup_pipeline(kind, user_id)
+        for row in db[coll_name].aggregate(pipeline): expected[key(row)] = (row['total'], row['count'])
+    stored = {key(row): (row['total'], row['count']) for row in db.monthly_rollups.find({"user_id": user_id} if user_id else {})}
+
+    mismatches = []
+    for k in set(expected) | set(stored):
+        exp_total, exp_count = expected.get(k, (0, 0))
+        got_total, got_count = stored.get(k, (0, 0))
+        if exp_count != got_count or abs(exp_total - got_total) > 0.005:
+            mismatches.append({
+                "user_id": k[0], "month": k[1], "kind": k[2], "category": k[3],
+                "expected": exp_total, "stored": got_total
+            })
+    return mismatches
+
+# Changes whenever INDEXES, OBSOLETE_INDEXES or TIME_SERIES do; a marker holding it
+# lets startup skip ensure_indexes, which costs a round trip per collection.
+INDEX_SPEC_HASH = hashlib.sha1(json.dumps(
+    [{c: [m.document for m in models] for c, models in INDEXES.items()}, OBSOLETE_INDEXES, TIME_SERIES],
+    sort_keys=True, default=str
+).encode()).hexdigest()
+
+WARM_UP_TIMEOUT_MS = int(os.getenv("WARM_UP_TIMEOUT_MS", 2000))
+WARM_UP_RETRY_SECONDS = 60
+
+def warm_up():
+    # Fail fast when the server is down instead of holding the first request for 30s.
+    with pymongo.timeout(WARM_UP_TIMEOUT_MS / 1000):
+        db.command("ping")
+    marker = db.app_meta.find_one({"_id": "indexes"})
+    if not marker or marker.get('hash') != INDEX_SPEC_HASH:
+        ensure_indexes()
+        db.app_meta.update_one({"_id": "indexes"}, {"$set": {"hash": INDEX_SPEC_HASH, "updated_at": datetime.utcnow()}}, upsert=True)
+    if not db.monthly_rollups.find_one({}, {"_id": 1}): run_startup_task("rollups", rebuild_rollups)
+    # Expenses written before search_tokens existed are invisible to search until indexed.
+    run_startup_task("search_index", build_search_index)
+
+def run_startup_task(name, task):
+    # Runs once per database: only the worker that inserts the marker runs the task,
+    # so workers starting together do not race (rebuild_rollups starts with a delete).
+    try:
+        if db.app_meta.find_one_and_update(
+                {"_id": name}, {"$setOnInsert": {"started_at": datetime.utcnow()}}, upsert=True) is not None:
+            return
+    except DuplicateKeyError:
+        return
+    try:
+        task()
+    except Exception:
+        db.app_meta.delete_one({"_id": name})
+        raise
+
+warm_lock = threading.Lock()
+warm_state = {"done": False, "retry_at": 0}
+
+@app.before_request
+def warm_up_once():
+    # Runs before the first request rather than at import, so workers, CLI commands
+    # and tests do not wait on MongoDB just to load the module.
+    if warm_state["done"] or time.monotonic() < warm_state["retry_at"]: return
+    with warm_lock:
+        if warm_state["done"] or time.monotonic() < warm_state["retry_at"]: return
+        try:
+            warm_up()
+            warm_state["done"] = True
+        except Exception as e:
+            warm_state["retry_at"] = time.monotonic() + WARM_UP_RETRY_SECONDS
+            app.logger.warning(f"Startup bootstrap skipped: {e}")
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    ensure_indexes()
+    click.echo("Indexes created.")
+
+@app.cli.command('migrate-dates')
+def migrate_dates_command():
+    for coll_name, count in migrate_date_fields().items():
+        click.echo(f"{coll_name}: {count} documents updated")
+
+@app.cli.command('migrate-investment-entries')
+@click.option('--batch-size', default=1000, show_default=True)
+def migrate_investment_entries_command(batch_size):
+    if is_time_series("investment_entries"):
+        click.echo("investment_entries is already a time-series collection.")
+        return
+    if client.server_info().get('versionArray', [0])[0] < 6:
+        raise click.ClickException("Time-series investment entries need MongoDB 6.0 or newer.")
+
+    legacy = "investment_entries_legacy"
+    db.investment_entries.rename(legacy)
+    db.create_collection("investment_entries", timeseries=TIME_SERIES["investment_entries"])
+    copied, batch = 0, []
+    for doc in db[legacy].find().batch_size(batch_size):
+        if not isinstance(doc.get('date_dt'), datetime): doc['date_dt'] = to_date(doc['date'])
+        batch.append(doc)
+        if len(batch) == batch_size:
+            db.investment_entries.insert_many(batch)
+            copied, batch = copied + len(batch), []
+    if batch:
+        db.investment_entries.insert_many(batch)
+        copied += len(batch)
+    ensure_indexes()
+    click.echo(f"{copied} entries copied; drop {legacy} once the data is verified.")
+
+@app.cli.command('build-search-index')
+@click.option('--rebuild', is_flag=True, help="Recompute tokens for every expense, not only the missing ones.")
+def build_search_index_command(rebuild):
+    click.echo(f"expenses: {build_search_index(rebuild)} documents indexed")
+
+@app.cli.command('collapse-installments')
+@click.option('--username', help="Only migrate this user's expenses.")
+def collapse_installments_command(username):
+    user_id = None
+    if username:
+        user = db.users.find_one({"username": username})
+        if not user: raise click.ClickException(f"User {username} not found")
+        user_id = user['_id']
+    report = collapse_installments(user_id)
+    click.echo(f"{report['plans']} plans created, {report['rows_removed']} rows removed, "
+               f"{report['rows_detached']} rows kept as edited installments, {report['skipped']} groups skipped")
+
+@app.cli.command('check-indexes')
+@click.option('--username', help="Replay the routes as this user instead of an empty one.")
+def check_indexes_command(username):
+    ensure_indexes()
+    user_id = None
+    if username:
+        user = db.users.find_one({"username": username})
+        if not user: raise click.ClickException(f"User {username} not found")
+        user_id = user['_id']
+    failures = check_query_plans(user_id)
+    for route, coll_name, query in failures:
+        click.echo(f"COLLSCAN in {route} ({coll_name}): {json.dumps(query)}", err=True)
+    if failures: raise SystemExit(1)
+    click.echo("All route queries use an index.")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--username', help="Only rebuild this user's rollups.")
+def rebuild_rollups_command(username):
+    user_id = None
+    if username:
+        user = db.users.find_one({"username": username})
+        if not user: raise click.ClickException(f"User {username} not found")
+        user_id = user['_id']
+    rebuild_rollups(user_id)
+    click.echo("Rollups rebuilt.")
+
+@app.cli.command('check-rollups')
+@click.option('--repair', is_flag=True, help="Rebuild the rollups of every user with drift.")
+def check_rollups_command(repair):
+    mismatches = check_rollups()
+    for m in mismatches:
+        click.echo(f"{m['user_id']} {m['month']} {m['kind']}/{m['category']}: expected {m['expected']:.2f}, stored {m['stored']:.2f}")
+    if mismatches and repair:
+        for user_id in {m['user_id'] for m in mismatches}: rebuild_rollups(user_id)
+        click.echo(f"Rebuilt rollups for {len({m['user_id'] for m in mismatches})} user(s).")
+    elif mismatches:
+        raise SystemExit(1)
+    else:
+        click.echo("Rollups are consistent.")
+
+@app.cli.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True)
+@click.option('--target', type=click.Choice(['expenses', 'macro_expenses', 'incomes']), default='expenses')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ofx']), help="Defaults to the file extension.")
+@click.option('--card', help="Card name or id applied to rows without one.")
+@click.option('--mapping', help='JSON object mapping fields to CSV columns, e.g. {"date": "Data"}.')
+@click.option('--decimal', type=click.Choice([',', '.']), help="CSV decimal separator; without it amounts like 1.234 are rejected.")
+@click.option('--sign', type=click.Choice(['bank', 'card']), default='bank', show_default=True,
+              help="CSV sign convention: bank (negative is money out) or card (negative is a refund).")
+def import_statement_command(path, username, target, fmt, card, mapping, decimal, sign):
+    user = db.users.find_one({"username": username})
+    if not user: raise click.ClickException(f"User {username} not found")
+    card_id = None
+    if card:
+        card_doc = next((c for c in db.credit_cards.find({"user_id": user['_id']}) if card in (str(c['_id']), c['name'])), None)
+        if not card_doc: raise click.ClickException(f"Card {card} not found")
+        card_id = card_doc['_id']
+
+    fmt = fmt or ('ofx' if path.lower().endswith('.ofx') else 'csv')
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as stream:
+        try:
+            records = statement_records(stream, fmt, parse_mapping(mapping) if mapping else None)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        report = import_statement(user['_id'], target, records, card_id, decimal, sign)
+    bump_data_version(user['_id'])
+
+    click.echo(f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+               f"{report['inserted']} inserted, {report['duplicates']} duplicates, {report['rejected']} rejected")
+    for err in report['errors']: click.echo(f"  line {err['line']}: {err['error']}", err=True)
+
 class User(UserMixin):
     def __init__(self, user_doc):
         self.id = str(user_doc['_id'])
         self.username = user_doc['username']
         self.password_hash = user_doc['password_hash']
+        self.data_version = user_doc.get('data_version', 0)
+        # Sessions remember this and die when the password changes. A hash upgrade on
+        # login pins the fingerprint of the hash it replaced, so it logs nobody out;
+        # any other change to password_hash no longer matches the pin.
+        pin = user_doc.get('fingerprint_pin') or {}
+        fingerprint = password_fingerprint(self.password_hash)
+        self.password_fingerprint = pin['fingerprint'] if pin.get('of') == fingerprint else fingerprint
+
+def password_fingerprint(password_hash):
+    return hashlib.sha1(password_hash.encode()).hexdigest()[:16]
+
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item and item[1] > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item: del self.data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize: self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0}
+
+response_cache = TTLCache(int(os.getenv("RESPONSE_CACHE_SIZE", 512)), int(os.getenv("RESPONSE_CACHE_TTL", 300)))
+user_cache = TTLCache(int(os.getenv("USER_CACHE_SIZE", 1024)), int(os.getenv("USER_CACHE_TTL", 60)))
+
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", 10000))
+query_executor = ThreadPoolExecutor(max_workers=int(os.getenv("QUERY_WORKERS", 8)), thread_name_prefix="query")
+
+class QueryTimeout(Exception):
+    pass
+
+def run_concurrently(queries, timeout_ms=QUERY_TIMEOUT_MS):
+    # Queries must not touch request or current_user: they run on pool threads.
+    futures = {name: query_executor.submit(copy_context().run, fn) for name, fn in queries.items()}
+    done, pending = wait(futures.values(), timeout=timeout_ms / 1000)
+    if pending:
+        for future in pending: future.cancel()
+        raise QueryTimeout(", ".join(name for name, f in futures.items() if f in pending))
+    return {name: future.result() for name, future in futures.items()}
+
+def aggregate_list(coll_name, pipeline):
+    return list(db[coll_name].aggregate(pipeline, maxTimeMS=QUERY_TIMEOUT_MS))
+
+@app.errorhandler(QueryTimeout)
+@app.errorhandler(ExecutionTimeout)
+def query_timeout(e):
+    return jsonify({"error": "Query timeout"}), 504
+
+def bump_data_version(user_id):
+    user_data = db.users.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"data_version": 1}},
+        projection={"data_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    version = user_data['data_version'] if user_data else 0
+    user = user_cache.get(str(user_id))
+    if user: user.data_version = max(user.data_version, version)
+    return version
+
+def current_data_version():
+    # The session carries the version of the browser's last write, so a cached User
+    # in another worker cannot hide that write from the same client.
+    return max(current_user.data_version, session.get('data_version', 0))
+
+@app.before_request
+def start_request_stats():
+    g.request_started = time.perf_counter()
+    request_stats.set(RequestStats(request.url_rule.rule if request.url_rule else "unmatched"))
+
+@app.after_request
+def add_server_timing(response):
+    stats = request_stats.get()
+    if stats:
+        elapsed = time.perf_counter() - g.request_started
+        request_seconds.observe(elapsed, route=stats.route)
+        request_queries.observe(stats.queries, route=stats.route)
+        request_db_bytes.observe(stats.bytes, route=stats.route)
+        response.headers.add('Server-Timing', f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries, {stats.documents} docs", app;dur={elapsed * 1000:.1f}')
+    return response
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 5))
+
+def response_encoding(size, mimetype):
+    if mimetype != 'application/json' or size < COMPRESS_MIN_BYTES: return 'identity'
+    if brotli and request.accept_encodings['br']: return 'br'
+    if request.accept_encodings['gzip']: return 'gzip'
+    return 'identity'
+
+def encode_body(data, encoding):
+    if encoding == 'br': return brotli.compress(data, quality=COMPRESS_LEVEL)
+    if encoding == 'gzip': return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    return data
+
+def set_encoded_body(response, body, encoding, size):
+    response.set_data(body)
+    if size >= COMPRESS_MIN_BYTES: response.vary.add('Accept-Encoding')
+    if encoding != 'identity': response.headers['Content-Encoding'] = encoding
+
+@app.after_request
+def compress_response(response):
+    # cached_view responses arrive already encoded and carry Content-Encoding.
+    if (response.status_code != 200 or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    encoding = response_encoding(len(data), response.mimetype)
+    set_encoded_body(response, encode_body(data, encoding), encoding, len(data))
+    return response
+
+@app.teardown_request
+def clear_request_stats(exc):
+    request_stats.set(None)
+
+@app.route('/metrics')
+def metrics():
+    if not METRICS_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        return Response(status=404)
+    gauges = [
+        "# TYPE finscope_mongo_pool_checked_out gauge",
+        f"finscope_mongo_pool_checked_out {pool_metrics.checked_out}",
+        "# TYPE finscope_cache_hits_total counter",
+        *(f'finscope_cache_hits_total{{cache="{name}"}} {cache.hits}' for name, cache in (("response", response_cache), ("user", user_cache))),
+        "# TYPE finscope_cache_misses_total counter",
+        *(f'finscope_cache_misses_total{{cache="{name}"}} {cache.misses}' for name, cache in (("response", response_cache), ("user", user_cache))),
+        "# TYPE finscope_login_rejected_total counter",
+        *(f'finscope_login_rejected_total{{reason="{reason}"}} {count}' for reason, count in sorted(login_rejections.items())),
+        "# TYPE finscope_password_hash_in_flight gauge",
+        f"finscope_password_hash_in_flight {hash_in_flight()}"
+    ]
+    body = "\n".join([m.render() for m in METRICS] + gauges) + "\n"
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.after_request
+def bump_version_after_write(response):
+    if (request.method in ('POST', 'PUT', 'DELETE') and request.path.startswith('/api/')
+            and response.status_code < 400 and current_user.is_authenticated):
+        user_id = ObjectId(current_user.id)
+        session['data_version'] = bump_data_version(user_id)
+    return response
+
+def cached_view(view):
+    # GET responses are keyed by the user's data version, which every write bumps,
+    # and by the date, since date windows, invoice states and forecasts move daily.
+    # The ETag covers the same fields and doubles as the cache key.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET': return view(*args, **kwargs)
+
+        version = current_data_version()
+        params = tuple(sorted(request.args.items(multi=True)))
+        etag = hashlib.sha1(f"{current_user.id}|{version}|{datetime.now():%Y-%m-%d}|{request.path}|{params}".encode()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        key = etag
+        cached = response_cache.get(key)
+        if cached is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed: return response
+            cached = {"mimetype": response.mimetype, "bodies": {"identity": response.get_data()}}
+            response_cache.set(key, cached)
+
+        # Each encoding is produced once per cached payload, not on every hit.
+        raw = cached["bodies"]["identity"]
+        encoding = response_encoding(len(raw), cached["mimetype"])
+        body = cached["bodies"].get(encoding)
+        if body is None: body = cached["bodies"][encoding] = encode_body(raw, encoding)
+        response = Response(mimetype=cached["mimetype"])
+        set_encoded_body(response, body, encoding, len(raw))
+        # Weak: the same payload may go out gzip- or brotli-encoded.
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
 
 @login_manager.user_loader
 def load_user(user_id):
+    fingerprint = session.get('pw')
+    user = user_cache.get(user_id)
+    if user and (not fingerprint or user.password_fingerprint == fingerprint): return user
     try:
         user_data = db.users.find_one({"_id": ObjectId(user_id)})
-        if user_data: return User(user_data)
+        if user_data:
+            user = User(user_data)
+            if fingerprint and user.password_fingerprint != fingerprint: return None
+            user_cache.set(user_id, user)
+            return user
     except Exception as e:
         pass
     return None
 
+def invalidate_user(user_id):
+    user_cache.pop(str(user_id))
+
+# Bookkeeping fields no endpoint sends unless a sparse fieldset asks otherwise.
+INTERNAL_FIELDS = ("user_id", "search_tokens", "date_dt", "content_hash", "created_at", "updated_at", "statement_version")
+FIELD_NAME_RE = re.compile(r'^[A-Za-z_]\w*$')
+
+def list_projection(args, required=()):
+    # `?fields=a,b` keeps only those fields (plus `_id` and `required`); without it
+    # everything but INTERNAL_FIELDS. card_name is derived from card_id.
+    fields = [f for f in args.get('fields', '').split(',') if FIELD_NAME_RE.match(f) and f not in INTERNAL_FIELDS]
+    if not fields: return dict.fromkeys(INTERNAL_FIELDS, 0)
+    projection = dict.fromkeys([*fields, *required], 1)
+    if projection.pop('card_name', None): projection['card_id'] = 1
+    return projection
+
 def serialize_doc(doc, source=None):
+    # ObjectIds and datetimes are encoded by FastJSONProvider.
     if not doc: return None
-    doc['_id'] = str(doc['_id'])
-    if 'user_id' in doc: doc['user_id'] = str(doc['user_id'])
-    if 'card_id' in doc and doc['card_id']: doc['card_id'] = str(doc['card_id'])
-    if 'investment_id' in doc: doc['investment_id'] = str(doc['investment_id'])
+    for field in INTERNAL_FIELDS: doc.pop(field, None)
     if source: doc['source'] = source
     return doc
 
+PLAN_SHARED_FIELDS = ("description", "amount", "category", "establishment", "buyer", "payment_method", "card_id")
+
+def installment_plan_id(user_id, description, amount, card_id, total, first_date):
+    key = f"{user_id}|{description}|{amount}|{card_id}|{total}|{first_date.strftime('%Y-%m-%d')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def income_doc(user_id, data):
+    return {
+        "user_id": user_id,
+        "description": data['description'],
+        "amount": float(data['amount']),
+        "date": data['date'],
+        "date_dt": to_date(data['date']),
+        "created_at": datetime.utcnow()
+    }
+
+def macro_expense_doc(user_id, data):
+    card_id = data.get('card_id')
+    return {
+        "user_id": user_id,
+        "description": data['description'],
+        "amount": float(data['amount']),
+        "category": data.get('category', 'General'),
+        "date": data['date'],
+        "date_dt": to_date(data['date']),
+        "payment_method": data.get('payment_method', 'debit'),
+        "card_id": ObjectId(card_id) if card_id else None,
+        "is_consolidated": True,
+        "created_at": datetime.utcnow()
+    }
+
+def expense_doc(user_id, data):
+    card_id = data.get('card_id')
+    return {
+        "user_id": user_id,
+        "description": data['description'],
+        "amount": float(data['amount']),
+        "category": data.get('category', 'General'),
+        "date": data['date'],
+        "date_dt": to_date(data['date']),
+        "establishment": data.get('establishment'),
+        "buyer": data.get('buyer'),
+        "payment_method": data.get('payment_method'),
+        "card_id": ObjectId(card_id) if card_id else None,
+        "installments": data.get('installments'),
+        "observation": data.get('observation'),
+        "search_tokens": search_tokens(*(data.get(f) for f in SEARCH_FIELDS)),
+        "is_consolidated": False,
+        "created_at": datetime.utcnow()
+    }
+
+def wallet_doc(user_id, data):
+    return {
+        "user_id": user_id,
+        "name": data['name'],
+        "balance": float(data['balance']),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
+def goal_doc(user_id, data):
+    return {
+        "user_id": user_id,
+        "title": data['title'],
+        "type": data.get('type', 'spending'),
+        "target_amount": float(data['target_amount']),
+        "current_amount": float(data.get('current_amount', 0)),
+        "deadline": data['deadline'],
+        "created_at": datetime.utcnow()
+    }
+
+AUTO_OBSERVATION_PREFIX = "[Gerado Auto]"
+
+def installment_plan_doc(user_id, data, current_inst, total_inst):
+    # One document per purchase; `schedule` holds each installment's date and a
+    # null for installments deleted or detached into a regular expense.
+    base_date = datetime.strptime(data['date'], '%Y-%m-%d')
+    card_id = ObjectId(data['card_id']) if data.get('card_id') else None
+    first_date = base_date - relativedelta(months=current_inst - 1)
+    observation = data.get('observation', '')
+    return {
+        "_id": installment_plan_id(user_id, data['description'], float(data['amount']), card_id, total_inst, first_date),
+        "user_id": user_id,
+        "description": data['description'],
+        "amount": float(data['amount']),
+        "category": data.get('category', 'General'),
+        "establishment": data.get('establishment'),
+        "buyer": data.get('buyer'),
+        "payment_method": data.get('payment_method'),
+        "card_id": card_id,
+        "observation": observation,
+        "auto_observation": f"{AUTO_OBSERVATION_PREFIX} {observation or ''}".strip(),
+        "anchor_index": current_inst,
+        "total_installments": total_inst,
+        "schedule": [(base_date + relativedelta(months=i - current_inst)).strftime('%Y-%m-%d') for i in range(1, total_inst + 1)],
+        "search_tokens": search_tokens(*(data.get(f) for f in SEARCH_FIELDS)),
+        "created_at": datetime.utcnow()
+    }
+
+def split_virtual_id(expense_id):
+    plan_id, _, index = (expense_id or '').partition(':')
+    return (plan_id, int(index)) if index.isdigit() else (None, None)
+
+def plan_match(query):
+    # Loosest installment_plans filter that still covers every row `query` matches;
+    # plan_rows_pipeline applies `query` itself once the rows are expanded.
+    match = {}
+    for key, value in query.items():
+        if key == "date": match["schedule"] = {"$elemMatch": value} if isinstance(value, dict) else value
+        elif key == "plan_id": match["_id"] = value
+        elif key == "$or": match["$or"] = [plan_match(q) for q in value]
+        elif key != "_id": match[key] = value
+    return match
+
+def plan_rows_pipeline(query):
+    return [
+        {"$match": plan_match(query)},
+        {"$unwind": {"path": "$schedule", "includeArrayIndex": "slot"}},
+        {"$match": {"schedule": {"$ne": None}}},
+        {"$addFields": {"installment_index": {"$add": ["$slot", 1]}}},
+        {"$project": {
+            "_id": {"$concat": ["$_id", ":", {"$toString": "$installment_index"}]},
+            "user_id": 1, "description": 1, "amount": 1, "category": 1, "establishment": 1,
+            "buyer": 1, "payment_method": 1, "card_id": 1, "search_tokens": 1, "created_at": 1,
+            "date": "$schedule",
+            "installments": {"$concat": [{"$toString": "$installment_index"}, "/", {"$toString": "$total_installments"}]},
+            "observation": {"$cond": [{"$eq": ["$installment_index", "$anchor_index"]}, "$observation", "$auto_observation"]},
+            "is_consolidated": {"$literal": False},
+            "plan_id": "$_id",
+            "installment_index": 1
+        }},
+        {"$match": query}
+    ]
+
+def expense_rows_pipeline(query):
+    # Stored expenses plus the virtual installment rows, in the same shape.
+    return [{"$match": query}, {"$unionWith": {"coll": "installment_plans", "pipeline": plan_rows_pipeline(query)}}]
+
+def collapse_installments(user_id=None):
+    # Folds installment rows materialized one document per month into installment_plans.
+    query = {"installments": {"$regex": r"^\d+/\d+$"}, "is_consolidated": {"$ne": True}, "content_hash": {"$exists": False}}
+    if user_id: query["user_id"] = user_id
+    groups = {}
+    for doc in db.expenses.find(query):
+        index, total = map(int, doc['installments'].split('/'))
+        if not 1 <= index <= total: continue
+        first_month = (to_date(doc['date']) - relativedelta(months=index - 1)).strftime('%Y-%m')
+        key = doc.get('plan_id') or (doc['user_id'], doc['description'], doc['amount'], doc.get('card_id'), total, first_month)
+        groups.setdefault(key, []).append((index, doc))
+
+    report = {"plans": 0, "rows_removed": 0, "rows_detached": 0, "skipped": 0}
+    migrated = set()
+    for key, rows in groups.items():
+        by_index = {}
+        for index, doc in rows: by_index.setdefault(index, []).append(doc)
+        auto = [i for i, docs in by_index.items() if (docs[0].get('observation') or '').startswith(AUTO_OBSERVATION_PREFIX)]
+        if any(len(docs) > 1 for docs in by_index.values()) or not (auto or isinstance(key, str)):
+            report['skipped'] += 1
+            continue
+
+        anchor_index = min((i for i in by_index if i not in auto), default=min(by_index))
+        anchor = by_index[anchor_index][0]
+        total = int(anchor['installments'].split('/')[1])
+        data = {**anchor, "card_id": str(anchor['card_id']) if anchor.get('card_id') else None, "date": anchor['date'][:10], "observation": anchor.get('observation') or ''}
+        plan = installment_plan_doc(anchor['user_id'], data, anchor_index, total)
+        if isinstance(key, str): plan['_id'] = key
+
+        removed, detached = [], []
+        for i in range(1, total + 1):
+            doc = by_index.get(i, [None])[0]
+            expected_observation = plan['observation'] if i == anchor_index else plan['auto_observation']
+            if doc and all(doc.get(f) == plan[f] for f in PLAN_SHARED_FIELDS) and (doc.get('observation') or '') == expected_observation:
+                plan['schedule'][i - 1] = doc['date']
+                removed.append(doc['_id'])
+            else:
+                plan['schedule'][i - 1] = None
+                if doc: detached.append((doc['_id'], i))
+
+        res = db.installment_plans.update_one({"_id": plan['_id']}, {"$setOnInsert": {k: v for k, v in plan.items() if k != '_id'}}, upsert=True)
+        if res.upserted_id is None:
+            report['skipped'] += 1
+            continue
+        for doc_id, i in detached:
+            db.expenses.update_one({"_id": doc_id}, {"$set": {"plan_id": plan['_id'], "installment_index": i}})
+        if removed: db.expenses.delete_many({"_id": {"$in": removed}})
+        report['plans'] += 1
+        report['rows_removed'] += len(removed)
+        report['rows_detached'] += len(detached)
+        migrated.add(plan['user_id'])
+    # Removed rows come back under virtual ids, so cached payloads and ETags must go.
+    for migrated_user in migrated: bump_data_version(migrated_user)
+    return report
+
+def date_range_query(user_id, args):
+    query = {"user_id": user_id}
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date: query["date"]["$gte"] = start_date
+        if end_date: query["date"]["$lte"] = end_date
+    return query
+
+def expense_search_query(user_id, args):
+    query = date_range_query(user_id, args)
+    terms = search_tokens(args.get('search'))
+    if terms:
+        # Anchored prefixes on the multikey index; input is escaped, never compiled as a pattern.
+        query["$and"] = [{"search_tokens": re.compile("^" + re.escape(t))} for t in terms]
+    return query, terms
+
+def closing_date(card, month_date):
+    return month_date.replace(day=min(card.get('closing_day', 1), monthrange(month_date.year, month_date.month)[1]))
+
+def invoice_period(card, ref_month_str):
+    # Short months close on their last day; the next cycle starts right after it.
+    ref_date = datetime.strptime(ref_month_str, '%Y-%m')
+    end_date = closing_date(card, ref_date)
+    start_date = closing_date(card, ref_date - relativedelta(months=1)) + timedelta(days=1)
+    return start_date, end_date
+
+def invoice_query(card, start_date, end_date):
+    return {
+        "user_id": card['user_id'],
+        "card_id": card['_id'],
+        "date": {"$gte": start_date.strftime('%Y-%m-%d'), "$lte": end_date.strftime('%Y-%m-%d')}
+    }
+
+INVOICE_MAX_MONTHS = 36
+BUYER_EXPR = {"$cond": [{"$eq": [{"$ifNull": ["$buyer", ""]}, ""]}, "Others", "$buyer"]}
+
+def month_range(from_month, to_month):
+    current = datetime.strptime(from_month, '%Y-%m')
+    last = datetime.strptime(to_month, '%Y-%m')
+    months = []
+    while current <= last and len(months) < INVOICE_MAX_MONTHS:
+        months.append(current.strftime('%Y-%m'))
+        current += relativedelta(months=1)
+    return months
+
+def invoice_due_date(card, end_date):
+    # Compared with the configured closing day: end_date is clamped in short months.
+    closing_day = card.get('closing_day') or end_date.day
+    due_day = card.get('due_day') or closing_day
+    due_month = end_date + relativedelta(months=1) if due_day <= closing_day else end_date
+    return due_month.replace(day=min(due_day, monthrange(due_month.year, due_month.month)[1]))
+
+def card_invoices(user_id, cards, months):
+    # Closed cycles come from card_statements; the open ones are bucketed by their
+    # closing-day boundaries in a single analytics query. A stored cycle only counts
+    # while it carries the card's current statement_version: totals computed before
+    # a concurrent backdated write may be saved after its invalidation, and are then
+    # ignored instead of served for good.
+    today = datetime.now().strftime('%Y-%m-%d')
+    versions = {c['_id']: c.get('statement_version', 0) for c in cards}
+    stored = {(s['card_id'], s['month']): s for s in db.card_statements.find(
+        {"user_id": user_id, "card_id": {"$in": list(versions)}, "month": {"$in": months}})
+        if s.get('version', 0) == versions[s['card_id']]}
+
+    cycles, spans = {}, {}
+    for card in cards:
+        cycles[card['_id']] = []
+        for month in months:
+            start_date, end_date = invoice_period(card, month)
+            cycles[card['_id']].append({
+                "month": month,
+                "start": start_date.strftime('%Y-%m-%d'),
+                "end": end_date.strftime('%Y-%m-%d'),
+                "due_date": invoice_due_date(card, end_date).strftime('%Y-%m-%d')
+            })
+        pending = [c for c in cycles[card['_id']] if (card['_id'], c['month']) not in stored]
+        if not pending: continue
+        first = cycles[card['_id']].index(pending[0])
+        last = cycles[card['_id']].index(pending[-1])
+        spans[card['_id']] = cycles[card['_id']][first:last + 1]
+
+    computed = {}
+    if spans:
+        computed = analytics.invoice_totals(user_id, spans)
+
+    result, closed_ops = {}, []
+    for card in cards:
+        result[card['_id']] = []
+        for cycle in cycles[card['_id']]:
+            key = (card['_id'], cycle['month'])
+            if key in stored:
+                totals = {f: stored[key][f] for f in ("total", "count", "buyers_summary")}
+            else:
+                totals = computed.get((card['_id'], cycle['start']), {"total": 0, "count": 0, "buyers_summary": {}})
+                if cycle['end'] < today:
+                    closed_ops.append(UpdateOne(
+                        {"user_id": user_id, "card_id": card['_id'], "month": cycle['month']},
+                        {"$set": {**totals, "start": cycle['start'], "end": cycle['end'], "version": versions[card['_id']], "closed_at": datetime.utcnow()}},
+                        upsert=True
+                    ))
+            result[card['_id']].append({**cycle, **totals, "closed": cycle['end'] < today})
+    if closed_ops: db.card_statements.bulk_write(closed_ops, ordered=False)
+    return result
+
+def invalidate_statements(user_id, card_ids=None, since=None):
+    # Drops persisted totals of closed cycles that a backdated write could change.
+    # Called after the write; only closed cycles (end < today) are ever stored.
+    if since and since[:10] >= datetime.now().strftime('%Y-%m-%d'): return
+    query, cards_query = {"user_id": user_id}, {"user_id": user_id}
+    if card_ids is not None:
+        card_ids = [c for c in card_ids if c]
+        if not card_ids: return
+        query["card_id"] = cards_query["_id"] = {"$in": card_ids}
+    db.credit_cards.update_many(cards_query, {"$inc": {"statement_version": 1}})
+    if since: query["end"] = {"$gte": since[:10]}
+    db.card_statements.delete_many(query)
+
+def invoice_months(args):
+    current = datetime.now().strftime('%Y-%m')
+    try:
+        return month_range(args.get('from', current), args.get('to', args.get('from', current)))
+    except ValueError:
+        return None
+
+def attach_card_names(docs, user_id, names=None):
+    if names is None:
+        card_ids = list({d['card_id'] for d in docs if d.get('card_id')})
+        if not card_ids: return docs
+        names = {c['_id']: c['name'] for c in db.credit_cards.find({"_id": {"$in": card_ids}, "user_id": user_id}, {"name": 1})}
+    for doc in docs:
+        if doc.get('card_id') in names: doc['card_name'] = names[doc['card_id']]
+    return docs
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+HASH_QUEUE = int(os.getenv("HASH_QUEUE", 2))
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", 900))
+LOGIN_MAX_FAILURES_USER = int(os.getenv("LOGIN_MAX_FAILURES_USER", 5))
+LOGIN_MAX_FAILURES_IP = int(os.getenv("LOGIN_MAX_FAILURES_IP", 30))
+
+# hashlib's scrypt and pbkdf2 release the GIL, so hashing on a small pool leaves the
+# request threads free; the slots cap how many logins may wait for it at once.
+hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash")
+hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+class HashBusy(Exception):
+    pass
+
+def hash_in_flight():
+    return HASH_WORKERS + HASH_QUEUE - hash_slots._value
+
+def timed_hash(op, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        password_hash_seconds.observe(time.perf_counter() - started, op=op)
+
+def run_hash(op, fn, *args):
+    # Never waits for a slot: at most HASH_WORKERS + HASH_QUEUE request threads can be
+    # parked on hashing, and the rest are turned away at once.
+    if not hash_slots.acquire(blocking=False): raise HashBusy(op)
+    try:
+        return hash_executor.submit(timed_hash, op, fn, *args).result()
+    finally:
+        hash_slots.release()
+
+@lru_cache(maxsize=None)
+def current_hash_prefix():
+    # e.g. "scrypt:32768:8:1": the method with werkzeug's defaults filled in.
+    return generate_password_hash("", PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+def verify_password(password_hash, password):
+    ok = check_password_hash(password_hash, password)
+    return ok, ok and password_hash.split('$', 1)[0] != current_hash_prefix()
+
+def rehash_password(user_data, password):
+    # Runs on a verified login, while the plain password is at hand.
+    try:
+        new_hash = run_hash("generate", generate_password_hash, password, PASSWORD_HASH_METHOD)
+    except HashBusy:
+        return user_data
+    pin = {"of": password_fingerprint(new_hash), "fingerprint": User(user_data).password_fingerprint}
+    updated = db.users.find_one_and_update(
+        {"_id": user_data['_id'], "password_hash": user_data['password_hash']},
+        {"$set": {"password_hash": new_hash, "fingerprint_pin": pin}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated: return user_data
+    invalidate_user(updated['_id'])
+    return updated
+
+class LoginThrottle:
+    # Failure counts per key in this process, forgotten `window` seconds after the last
+    # failure. A plain dict, never an LRU: spraying other usernames must not evict a
+    # victim's count. Expired keys are swept as the table grows; it stays bounded
+    # because ip_throttle stops each address after LOGIN_MAX_FAILURES_IP failures.
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.failures = {}
+        self.sweep_at = 1024
+        self.lock = threading.Lock()
+
+    def blocked(self, key):
+        with self.lock:
+            count, expires = self.failures.get(key, (0, 0))
+        return count >= self.limit and expires > time.monotonic()
+
+    def fail(self, key):
+        now = time.monotonic()
+        with self.lock:
+            count, expires = self.failures.get(key, (0, 0))
+            self.failures[key] = (count + 1 if expires > now else 1, now + self.window)
+            if len(self.failures) >= self.sweep_at:
+                self.failures = {k: v for k, v in self.failures.items() if v[1] > now}
+                self.sweep_at = max(1024, 2 * len(self.failures))
+
+    def reset(self, key):
+        with self.lock:
+            self.failures.pop(key, None)
+
+user_throttle = LoginThrottle(LOGIN_MAX_FAILURES_USER, LOGIN_WINDOW_SECONDS)
+ip_throttle = LoginThrottle(LOGIN_MAX_FAILURES_IP, LOGIN_WINDOW_SECONDS)
+login_rejections = {"invalid": 0, "throttled_user": 0, "throttled_ip": 0, "busy": 0}
+login_rejections_lock = threading.Lock()
+
+def reject_login(template, reason):
+    with login_rejections_lock: login_rejections[reason] += 1
+    if reason == 'busy':
+        flash('Servidor ocupado, tente novamente em instantes.')
+        return render_template(template), 503, {'Retry-After': '1'}
+    flash('Muitas tentativas. Tente novamente mais tarde.')
+    return render_template(template), 429, {'Retry-After': str(LOGIN_WINDOW_SECONDS)}
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
+        ip = request.remote_addr
+        # Throttled attempts are turned away before they cost a hash.
+        if ip_throttle.blocked(ip): return reject_login('login.html', 'throttled_ip')
+        if user_throttle.blocked(username): return reject_login('login.html', 'throttled_user')
         user_data = db.users.find_one({"username": username})
-        if user_data and check_password_hash(user_data['password_hash'], password):
+        try:
+            ok, stale = run_hash("check", verify_password, user_data['password_hash'], password) if user_data else (False, False)
+        except HashBusy:
+            return reject_login('login.html', 'busy')
+        if ok:
+            user_throttle.reset(username)
+            if stale: user_data = rehash_password(user_data, password)
             user = User(user_data)
             session.permanent = True
+            session['pw'] = user.password_fingerprint
             login_user(user)
             return redirect(url_for('index'))
         else:
+            user_throttle.fail(username)
+            ip_throttle.fail(ip)
+            with login_rejections_lock: login_rejections['invalid'] += 1
             flash('Usuário ou senha inválidos')
     return render_template('login.html')
 
@@ -72,11 +1444,17 @@ def login():
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
+        ip = request.remote_addr
+        if ip_throttle.blocked(ip): return reject_login('register.html', 'throttled_ip')
         if db.users.find_one({"username": username}):
+            ip_throttle.fail(ip)
             flash('Nome de usuário já existe.')
         else:
-            hashed_password = generate_password_hash(password)
+            try:
+                hashed_password = run_hash("generate", generate_password_hash, password, PASSWORD_HASH_METHOD)
+            except HashBusy:
+                return reject_login('register.html', 'busy')
             db.users.insert_one({"username": username, "password_hash": hashed_password, "created_at": datetime.utcnow()})
             flash('Conta criada! Faça login.')
             return redirect(url_for('login'))
@@ -85,13 +1463,17 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
+    session.pop('pw', None)
+    session.pop('data_version', None)
     logout_user()
     return redirect(url_for('login'))
 
 @app.route('/')
 @login_required
 def index():
-    return render_template('index.html', username=current_user.username)
+    bootstrap = bootstrap_payload(ObjectId(current_user.id), MultiDict(INLINE_BOOTSTRAP_ARGS)) if INLINE_BOOTSTRAP else None
+    return render_template('index.html', username=current_user.username, bootstrap=bootstrap)
 
 @app.route('/detailed')
 @login_required
@@ -118,8 +1500,14 @@ def goals_page():
 def wallet_page():
     return render_template('wallet.html')
 
+@app.route('/api/cache-stats', methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify({"users": user_cache.stats(), "responses": response_cache.stats()})
+
 @app.route('/api/settings', methods=['GET', 'POST'])
 @login_required
+@cached_view
 def settings():
     if request.method == 'POST':
         data = request.json
@@ -129,22 +1517,35 @@ def settings():
         db.user_settings.update_one({"user_id": ObjectId(current_user.id)}, {"$set": update_data}, upsert=True)
         return jsonify({"status": "success"})
 
-    settings = db.user_settings.find_one({"user_id": ObjectId(current_user.id)})
+    return jsonify(settings_payload(ObjectId(current_user.id)))
+
+def settings_payload(user_id):
+    settings = db.user_settings.find_one({"user_id": user_id})
     if not settings:
-        return jsonify({"categories": ["Food", "Housing", "Transport"], "buyers": ["Me"]})
-    return jsonify(serialize_doc(settings))
+        return {"categories": ["Food", "Housing", "Transport"], "buyers": ["Me"]}
+    return serialize_doc(settings)
 
 @app.route('/api/years', methods=['GET'])
 @login_required
+@cached_view
 def get_years():
+    return jsonify(years_payload(ObjectId(current_user.id)))
+
+def years_payload(user_id):
     pipeline = [
-        {"$match": {"user_id": ObjectId(current_user.id)}},
-        {"$project": {"year": {"$substr": ["$date", 0, 4]}}},
+        {"$match": {"user_id": user_id}},
+        {"$project": {"_id": 0, "year": {"$substr": ["$date", 0, 4]}}},
         {"$group": {"_id": "$year"}}
     ]
-    years_inc = list(db.incomes.aggregate(pipeline))
-    years_exp = list(db.expenses.aggregate(pipeline))
-    years_macro = list(db.macro_expenses.aggregate(pipeline))
+    queries = {coll_name: partial(aggregate_list, coll_name, pipeline) for coll_name in ("incomes", "expenses", "macro_expenses")}
+    queries["installment_plans"] = partial(aggregate_list, "installment_plans", [
+        {"$match": {"user_id": user_id}},
+        {"$unwind": "$schedule"},
+        {"$match": {"schedule": {"$ne": None}}},
+        {"$group": {"_id": {"$substr": ["$schedule", 0, 4]}}}
+    ])
+    years = run_concurrently(queries)
+    years_inc, years_exp, years_macro = years['incomes'], years['expenses'] + years['installment_plans'], years['macro_expenses']
     
     all_years = set()
     for y in years_inc: all_years.add(y['_id'])
@@ -153,10 +1554,11 @@ def get_years():
     
     current_year = str(datetime.now().year)
     all_years.add(current_year)
-    return jsonify(sorted(list(all_years), reverse=True))
+    return sorted(list(all_years), reverse=True)
 
 @app.route('/api/balance', methods=['GET'])
 @login_required
+@cached_view
 def get_total_balance():
     pipeline = [
         {"$match": {"user_id": ObjectId(current_user.id)}},
@@ -168,56 +1570,277 @@ def get_total_balance():
 
 @app.route('/api/transactions', methods=['GET'])
 @login_required
+@cached_view
 def get_transactions():
-    page = int(request.args.get('page', 1))
-    items_per_page = int(request.args.get('limit', 30))
-    date_filter = request.args.get('date')
-    scope = request.args.get('scope', 'macro')
-    
-    user_id = ObjectId(current_user.id)
+    return jsonify(transactions_payload(ObjectId(current_user.id), request.args))
+
+class InvalidCursor(ValueError):
+    pass
+
+@app.errorhandler(InvalidCursor)
+def invalid_cursor(e):
+    return jsonify({"error": "Invalid cursor"}), 400
+
+def parse_cursor(after):
+    # "<date>,<id>" as built from the last row of the previous page.
+    after_date, _, after_id = after.partition(',')
+    try:
+        to_date(after_date)
+    except ValueError:
+        raise InvalidCursor(after)
+    if not (ObjectId.is_valid(after_id) or split_virtual_id(after_id)[0]): raise InvalidCursor(after)
+    return after_date, after_id
+
+def transactions_payload(user_id, args, card_names=None):
+    page = int(args.get('page', 1))
+    items_per_page = int(args.get('limit', 30))
+    date_filter = args.get('date')
+    scope = args.get('scope', 'macro')
+    after = args.get('after')
+    cursor_mode = after is not None
+    with_count = args.get('count', '0' if cursor_mode else '1') == '1'
 
     match_query = {"user_id": user_id}
     if date_filter:
         if len(date_filter) == 7:
-            match_query["date"] = {"$regex": f"^{date_filter}"}
+            match_query["date"] = {"$gte": f"{date_filter}-01", "$lte": f"{date_filter}-31"}
         else:
             match_query["date"] = date_filter
 
+    branch_query = dict(match_query)
+    if after:
+        # Virtual installment ids are strings, which sort below every ObjectId.
+        after_date, after_id = parse_cursor(after)
+        if ObjectId.is_valid(after_id):
+            branch_query["$or"] = [{"date": {"$lt": after_date}}, {"date": after_date, "_id": {"$lt": ObjectId(after_id)}}, {"date": after_date, "_id": {"$type": "string"}}]
+        else:
+            branch_query["$or"] = [{"date": {"$lt": after_date}}, {"date": after_date, "_id": {"$lt": after_id}}]
+
     expense_coll = "expenses" if scope == 'micro' else "macro_expenses"
     source_label = "micro" if scope == 'micro' else "macro"
 
-    pipeline = [
-        {"$unionWith": {"coll": expense_coll, "pipeline": [{"$addFields": {"type": "expense", "source": source_label}}]}},
-        {"$match": match_query},
-        {"$sort": {"date": -1}},
-        {"$facet": {
-            "metadata": [{"$count": "total"}],
-            "data": [{"$skip": (page - 1) * items_per_page}, {"$limit": items_per_page}]
-        }}
+    # Each branch is filtered, sorted and cut on its own index before the union,
+    # so a page never touches more than `fetch` rows per collection.
+    fetch = items_per_page + 1 if cursor_mode else page * items_per_page
+    skip = 0 if cursor_mode else (page - 1) * items_per_page
+    sort = {"date": -1, "_id": -1}
+
+    def branch(type_label, source):
+        return [
+            {"$match": branch_query},
+            {"$sort": sort},
+            {"$limit": fetch},
+            {"$addFields": {"type": type_label, "source": source}}
+        ]
+
+    pipeline = branch("income", "income") + [{"$unionWith": {"coll": expense_coll, "pipeline": branch("expense", source_label)}}]
+    if scope == 'micro':
+        pipeline.append({"$unionWith": {"coll": "installment_plans", "pipeline": plan_rows_pipeline(branch_query) + branch("expense", source_label)[1:]}})
+    pipeline += [
+        {"$sort": sort},
+        {"$skip": skip},
+        {"$limit": fetch - skip},
+        {"$project": list_projection(args, required=("date", "type", "source"))}
     ]
+    transactions = list(db.incomes.aggregate(pipeline))
+
+    next_cursor = None
+    if cursor_mode and len(transactions) > items_per_page:
+        transactions = transactions[:items_per_page]
+        last = transactions[-1]
+        next_cursor = f"{last['date']},{last['_id']}"
+
+    serialized_transactions = [serialize_doc(t) for t in attach_card_names(transactions, user_id, card_names)]
+    response = {"items": serialized_transactions, "next_cursor": next_cursor}
+
+    if with_count:
+        total_items = db.incomes.count_documents(match_query) + db[expense_coll].count_documents(match_query)
+        if scope == 'micro':
+            total_items += sum(r['count'] for r in db.installment_plans.aggregate(plan_rows_pipeline(match_query) + [{"$count": "count"}]))
+        response["total_items"] = total_items
+        response["total_pages"] = (total_items + items_per_page - 1) // items_per_page
+    if not cursor_mode:
+        response["current_page"] = page
+    return response
+
+GRANULARITY_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+SERIES_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+
+# The dashboard, invoice and series aggregations, kept together on `analytics`.
+
+class MongoAnalytics:
+    def summary(self, user_id, date_filter, rollup_filter=None):
+        def branch(kind, match, field):
+            return [
+                {"$match": match},
+                {"$project": {"_id": 0, field: 1}},
+                {"$group": {"_id": None, "total": {"$sum": f"${field}"}}},
+                {"$project": {"_id": 0, "kind": {"$literal": kind}, "total": 1}}
+            ]
 
-    incomes_pipeline_base = [{"$addFields": {"type": "income", "source": "income"}}]
-    result = list(db.incomes.aggregate(incomes_pipeline_base + pipeline))
+        if rollup_filter is not None:
+            base_coll = "monthly_rollups"
+            pipeline = [
+                {"$match": {**rollup_filter, "kind": {"$in": ["income", "expense"]}}},
+                {"$group": {"_id": "$kind", "total": {"$sum": "$total"}}},
+                {"$project": {"_id": 0, "kind": "$_id", "total": 1}}
+            ]
+        else:
+            base_coll = "incomes"
+            pipeline = branch("income", {"user_id": user_id, **date_filter}, "amount") + [
+                {"$unionWith": {"coll": "macro_expenses", "pipeline": branch("expense", {"user_id": user_id, **date_filter}, "amount")}}
+            ]
 
-    total_items = result[0]['metadata'][0]['total'] if result and result[0]['metadata'] else 0
-    transactions = result[0]['data'] if result and result[0]['data'] else []
+        totals = {"total_income": "income", "total_expense": "expense", "balance": "balance", "total_invested": "invested"}
+        pipeline += [
+            {"$unionWith": {"coll": "wallets", "pipeline": branch("balance", {"user_id": user_id}, "balance")}},
+            {"$unionWith": {"coll": "investments", "pipeline": branch("invested", {"user_id": user_id}, "current_amount")}},
+            {"$group": {"_id": None, **{name: {"$sum": {"$cond": [{"$eq": ["$kind", kind]}, "$total", 0]}} for name, kind in totals.items()}}},
+            {"$project": {"_id": 0, **{name: 1 for name in totals}, "net_worth": {"$add": ["$balance", "$total_invested"]}}}
+        ]
+        res = aggregate_list(base_coll, pipeline)
+        if not res: return {"total_income": 0, "total_expense": 0, "balance": 0, "total_invested": 0, "net_worth": 0}
+        return res[0]
+
+    def series(self, user_id, kind, date_filter, granularity):
+        # {period: total} of incomes, macro expenses or investment contributions.
+        coll_name, extra = {"income": ("incomes", {}), "expense": ("macro_expenses", {}),
+                            "investment": ("investment_entries", {"type": "contribution"})}[kind]
+        pipeline = [
+            {"$match": {"user_id": user_id, **date_filter, **extra}},
+            {"$group": {"_id": {"$dateToString": {"format": GRANULARITY_FORMATS[granularity], "date": DATE_EXPR}}, "total": {"$sum": "$amount"}}},
+            {"$sort": {"_id": 1}}
+        ]
+        return {item['_id']: item['total'] for item in aggregate_list(coll_name, pipeline)}
 
-    serialized_transactions = [serialize_doc(t) for t in transactions]
+    def category_series(self, user_id, kind, date_filter, granularity):
+        coll_name, category = ("incomes", {"$literal": "Income"}) if kind == "income" else ("macro_expenses", {"$ifNull": ["$category", "Others"]})
+        return aggregate_list(coll_name, [
+            {"$match": {"user_id": user_id, **date_filter}},
+            {"$project": {"amount": 1, "date": 1, "date_dt": 1, "category": category}},
+            {"$group": {
+                "_id": {"date": {"$dateToString": {"format": GRANULARITY_FORMATS[granularity], "date": DATE_EXPR}}, "category": "$category"},
+                "total": {"$sum": "$amount"}
+            }},
+            {"$sort": {"_id.date": 1}}
+        ])
+
+    def invoice_totals(self, user_id, spans):
+        # Card expenses bucketed by closing-day boundaries, one $facet per card.
+        # `spans` maps card ids to consecutive cycles; keys are (card_id, cycle start).
+        facets, match_or = {}, []
+        for card_id, span in spans.items():
+            upper = (datetime.strptime(span[-1]['end'], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            date_range = {"$gte": span[0]['start'], "$lt": upper}
+            match_or.append({"card_id": card_id, "date": date_range})
+            facets[str(card_id)] = [
+                {"$match": {"card_id": card_id, "date": date_range}},
+                {"$group": {"_id": {"date": "$date", "buyer": BUYER_EXPR}, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$bucket": {
+                    "groupBy": "$_id.date",
+                    "boundaries": [c['start'] for c in span] + [upper],
+                    "output": {
+                        "total": {"$sum": "$total"},
+                        "count": {"$sum": "$count"},
+                        "buyers": {"$push": {"buyer": "$_id.buyer", "total": "$total"}}
+                    }
+                }}
+            ]
 
-    return jsonify({
-        "items": serialized_transactions,
-        "total_items": total_items,
-        "current_page": page,
-        "total_pages": (total_items + items_per_page - 1) // items_per_page
-    })
+        computed = {}
+        if not facets: return computed
+        res = aggregate_list("expenses", expense_rows_pipeline({"user_id": user_id, "$or": match_or}) + [{"$facet": facets}])
+        for card_key, buckets in res[0].items():
+            for bucket in buckets:
+                buyers_summary = {}
+                for b in bucket['buyers']: buyers_summary[b['buyer']] = buyers_summary.get(b['buyer'], 0) + b['total']
+                computed[(ObjectId(card_key), bucket['_id'])] = {"total": bucket['total'], "count": bucket['count'], "buyers_summary": buyers_summary}
+        return computed
+
+    def investment_points(self, user_id, investment_ids, resolution):
+        # Per-period flows of each investment with running and overall net sums.
+        signed = {"$cond": [{"$eq": ["$type", "withdrawal"]}, {"$multiply": ["$amount", -1]}, "$amount"]}
+        points = aggregate_list("investment_entries", [
+            {"$match": {"user_id": user_id, "investment_id": {"$in": investment_ids}}},
+            {"$group": {
+                "_id": {"investment_id": "$investment_id", "period": {"$dateToString": {"format": SERIES_FORMATS[resolution], "date": DATE_EXPR}}},
+                "contributions": {"$sum": {"$cond": [{"$eq": ["$type", "withdrawal"]}, 0, "$amount"]}},
+                "withdrawals": {"$sum": {"$cond": [{"$eq": ["$type", "withdrawal"]}, "$amount", 0]}},
+                "net": {"$sum": signed}
+            }},
+            {"$setWindowFields": {
+                "partitionBy": "$_id.investment_id",
+                "sortBy": {"_id.period": 1},
+                "output": {
+                    "running": {"$sum": "$net", "window": {"documents": ["unbounded", "current"]}},
+                    "total_net": {"$sum": "$net", "window": {"documents": ["unbounded", "unbounded"]}}
+                }
+            }},
+            {"$sort": {"_id.investment_id": 1, "_id.period": 1}}
+        ])
+        return [{**p['_id'], **{f: p[f] for f in ("contributions", "withdrawals", "running", "total_net")}} for p in points]
+
+analytics = MongoAnalytics()
+
+MAX_CHART_POINTS = int(os.getenv("MAX_CHART_POINTS", 1000))
+
+def pivot_series(dates, names, totals, series=None):
+    # Dense (series x date) matrix of aggregated totals, date keys sorted.
+    import numpy as np
+    date_keys, date_idx = np.unique(np.asarray(dates, dtype=str), return_inverse=True)
+    if series is None:
+        series, name_idx = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+        series = series.tolist()
+    else:
+        name_idx = np.array([series.index(n) for n in names], dtype=int)
+    matrix = np.zeros((len(series), len(date_keys)))
+    np.add.at(matrix, (name_idx, date_idx), np.asarray(totals, dtype=float))
+    return date_keys.tolist(), series, matrix
+
+def chart_points(args):
+    # LTTB keeps both endpoints plus one point per bucket, so 3 is the smallest budget.
+    return max(3, min(args.get('max_points', MAX_CHART_POINTS, type=int), MAX_CHART_POINTS))
+
+def lttb_indices(matrix, max_points):
+    # Largest-Triangle-Three-Buckets over every series at once: each kept column
+    # maximizes the triangle area summed across series, so datasets share labels.
+    import numpy as np
+    n = matrix.shape[1]
+    if n <= max_points: return np.arange(n)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    keep = np.empty(max_points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = matrix[:, hi:next_hi].mean(axis=1, keepdims=True)
+        ay = matrix[:, [a]]
+        area = np.abs((x[a] - avg_x) * (matrix[:, lo:hi] - ay) - (x[a] - x[lo:hi]) * (avg_y - ay)).sum(axis=0)
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def chart_label(key, granularity):
+    if granularity == 'day': return datetime.strptime(key, '%Y-%m-%d').strftime('%d/%m')
+    if granularity == 'month': return datetime.strptime(key, '%Y-%m').strftime('%m/%Y')
+    return key
 
 @app.route('/api/dashboard', methods=['GET'])
 @login_required
+@cached_view
 def get_dashboard_data():
-    period = request.args.get('period', 'all')
-    year = request.args.get('year', str(datetime.now().year))
-    granularity = request.args.get('granularity', 'month')
-    view_mode = request.args.get('view_mode', 'general')
+    return jsonify(dashboard_payload(ObjectId(current_user.id), request.args))
+
+def dashboard_payload(user_id, args):
+    period = args.get('period', 'all')
+    year = args.get('year', str(datetime.now().year))
+    granularity = args.get('granularity', 'month')
+    if granularity not in GRANULARITY_FORMATS: granularity = 'month'
+    view_mode = args.get('view_mode', 'general')
+    max_points = chart_points(args)
 
     date_filter = {}
     if period != 'all':
@@ -232,94 +1855,51 @@ def get_dashboard_data():
         
         date_filter = {"date": {"$gte": start_date.strftime('%Y-%m-%d'), "$lte": end_date.strftime('%Y-%m-%d')}}
 
-    user_id_filter = {"user_id": ObjectId(current_user.id)}
-    
-    total_income = sum(d['amount'] for d in db.incomes.find({**user_id_filter, **date_filter}))
-    total_expense_macro = sum(d['amount'] for d in db.macro_expenses.find({**user_id_filter, **date_filter}))
-    total_expense = total_expense_macro
-
-    balance_res = list(db.wallets.aggregate([{"$match": user_id_filter}, {"$group": {"_id": None, "total": {"$sum": "$balance"}}}]))
-    balance = balance_res[0]['total'] if balance_res else 0
-
-    invested_res = list(db.investments.aggregate([{"$match": user_id_filter}, {"$group": {"_id": None, "total": {"$sum": "$current_amount"}}}]))
-    total_invested = invested_res[0]['total'] if invested_res else 0
-
-    summary = {
-        "total_income": total_income,
-        "total_expense": total_expense,
-        "balance": balance,
-        "total_invested": total_invested,
-        "net_worth": balance + total_invested
-    }
+    user_id_filter = {"user_id": user_id}
 
-    if granularity == 'day':
-        group_id = {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": "$date"}}}
-        sort_field = "_id"
-    elif granularity == 'year':
-        group_id = {"$substr": ["$date", 0, 4]}
-        sort_field = "_id"
-    else:
-        group_id = {"$substr": ["$date", 0, 7]}
-        sort_field = "_id"
+    # Month-aligned periods are answered from monthly_rollups instead of the raw ledgers.
+    rollup_filter = {**user_id_filter, "count": {"$gt": 0}}
+    if period == 'year': rollup_filter["month"] = {"$gte": f"{year}-01", "$lte": f"{year}-12"}
+    rollup_period = "$month" if granularity == 'month' else {"$substr": ["$month", 0, 4]}
+
+
+    # The summary and the chart pipelines are independent, so they are dispatched together.
+    queries = {"summary": partial(analytics.summary, user_id, date_filter, rollup_filter if period in ('all', 'year') else None)}
+
+    use_rollups = granularity in ('month', 'year') and period in ('all', 'year')
 
     chart_data = {}
 
     if view_mode == 'category':
-        pipeline_macro = [
-            {"$match": {**user_id_filter, **date_filter}},
-            {"$project": {"amount": 1, "date": 1, "category": {"$ifNull": ["$category", "Others"]}}},
-            {"$group": {
-                "_id": {"date": group_id, "category": "$category"},
-                "total": {"$sum": "$amount"}
-            }},
-            {"$sort": {"_id.date": 1}}
-        ]
-        results_macro = list(db.macro_expenses.aggregate(pipeline_macro))
-        
-        pipeline_income = [
-            {"$match": {**user_id_filter, **date_filter}},
-            {"$project": {"amount": 1, "date": 1, "category": {"$literal": "Income"}}},
-            {"$group": {
-                "_id": {"date": group_id, "category": "$category"},
-                "total": {"$sum": "$amount"}
-            }},
-            {"$sort": {"_id.date": 1}}
-        ]
-        results_income = list(db.incomes.aggregate(pipeline_income))
-        
-        results = results_macro + results_income
-        
-        data_map = {}
-        all_categories = set()
-        all_dates = set()
-
-        for item in results:
-            date_key = item['_id']['date']
-            cat = item['_id']['category']
-            total = item['total']
-            
-            if date_key not in data_map: data_map[date_key] = {}
-            data_map[date_key][cat] = total
-            all_categories.add(cat)
-            all_dates.add(date_key)
-            
-        sorted_dates = sorted(list(all_dates))
-        sorted_categories = sorted(list(all_categories))
-        
-        labels = []
-        for key in sorted_dates:
-            if granularity == 'day':
-                labels.append(datetime.strptime(key, '%Y-%m-%d').strftime('%d/%m'))
-            elif granularity == 'month':
-                labels.append(datetime.strptime(key, '%Y-%m').strftime('%m/%Y'))
-            else:
-                labels.append(key)
+        if use_rollups:
+            queries["rollups"] = partial(aggregate_list, "monthly_rollups", [
+                {"$match": {**rollup_filter, "kind": {"$in": ["income", "expense"]}}},
+                {"$group": {
+                    "_id": {"date": rollup_period, "category": "$category"},
+                    "total": {"$sum": "$total"}
+                }},
+                {"$sort": {"_id.date": 1}}
+            ])
+        else:
+            queries["macro"] = partial(analytics.category_series, user_id, "expense", date_filter, granularity)
+            queries["income"] = partial(analytics.category_series, user_id, "income", date_filter, granularity)
+
+        res = run_concurrently(queries)
+        summary = res['summary']
+        results = res['rollups'] if use_rollups else res['macro'] + res['income']
+
+        sorted_dates, sorted_categories, matrix = pivot_series(
+            [item['_id']['date'] for item in results],
+            [item['_id']['category'] for item in results],
+            [item['total'] for item in results]
+        )
+        keep = lttb_indices(matrix, max_points)
+        labels = [chart_label(sorted_dates[i], granularity) for i in keep]
+        matrix = matrix[:, keep]
 
         datasets = []
         for idx, cat in enumerate(sorted_categories):
-            data_points = []
-            for date_key in sorted_dates:
-                data_points.append(data_map.get(date_key, {}).get(cat, 0))
+            data_points = matrix[idx].tolist()
             
             if cat == 'Income':
                 color = "#2ecc71"
@@ -341,41 +1921,38 @@ def get_dashboard_data():
         chart_data = {"labels": labels, "datasets": datasets}
 
     else:
-        def aggregate_by_granularity(collection, amount_field='amount', extra_filter=None):
-            match_filter = {**user_id_filter, **date_filter}
-            if extra_filter:
-                match_filter.update(extra_filter)
-                
-            pipeline = [
-                {"$match": match_filter},
-                {"$group": {"_id": group_id, "total": {"$sum": f"${amount_field}"}}},
-                {"$sort": {sort_field: 1}}
-            ]
-            return {item['_id']: item['total'] for item in collection.aggregate(pipeline)}
-
-        income_data = aggregate_by_granularity(db.incomes)
-        expense_macro_data = aggregate_by_granularity(db.macro_expenses)
-        investment_data = aggregate_by_granularity(db.investment_entries, extra_filter={"type": "contribution"})
-
-        all_keys = sorted(list(set(income_data.keys()) | set(expense_macro_data.keys()) | set(investment_data.keys())))
-        
-        labels = []
-        income_values = []
-        expense_values = []
-        investment_values = []
-
-        for key in all_keys:
-            if granularity == 'day':
-                labels.append(datetime.strptime(key, '%Y-%m-%d').strftime('%d/%m'))
-            elif granularity == 'month':
-                labels.append(datetime.strptime(key, '%Y-%m').strftime('%m/%Y'))
-            else:
-                labels.append(key)
-            
-            income_values.append(income_data.get(key, 0))
-            total_exp = expense_macro_data.get(key, 0)
-            expense_values.append(total_exp)
-            investment_values.append(investment_data.get(key, 0))
+        if use_rollups:
+            queries["rollups"] = partial(aggregate_list, "monthly_rollups", [
+                {"$match": {**rollup_filter, "$or": [
+                    {"kind": {"$in": ["income", "expense"]}},
+                    {"kind": "investment", "category": "contribution"}
+                ]}},
+                {"$group": {"_id": {"date": rollup_period, "kind": "$kind"}, "total": {"$sum": "$total"}}}
+            ])
+        else:
+            for kind in ("income", "expense", "investment"):
+                queries[kind] = partial(analytics.series, user_id, kind, date_filter, granularity)
+
+        res = run_concurrently(queries)
+        summary = res['summary']
+        if use_rollups:
+            income_data, expense_macro_data, investment_data = {}, {}, {}
+            series = {"income": income_data, "expense": expense_macro_data, "investment": investment_data}
+            for item in res['rollups']:
+                series[item['_id']['kind']][item['_id']['date']] = item['total']
+        else:
+            income_data, expense_macro_data, investment_data = res['income'], res['expense'], res['investment']
+
+        named = (("income", income_data), ("expense", expense_macro_data), ("investment", investment_data))
+        all_keys, _, matrix = pivot_series(
+            [key for _, data in named for key in data],
+            [name for name, data in named for _ in data],
+            [total for _, data in named for total in data.values()],
+            series=[name for name, _ in named]
+        )
+        keep = lttb_indices(matrix, max_points)
+        labels = [chart_label(all_keys[i], granularity) for i in keep]
+        income_values, expense_values, investment_values = matrix[:, keep].tolist()
 
         chart_data = {
             "labels": labels,
@@ -386,14 +1963,242 @@ def get_dashboard_data():
             ]
         }
 
-    return jsonify({
+    return {
         "summary": summary,
         "chart_data": chart_data
+    }
+
+FORECAST_MAX_MONTHS = 60
+FORECAST_HISTORY_MONTHS = int(os.getenv("FORECAST_HISTORY_MONTHS", 12))
+FORECAST_Z = 1.2816  # 10th/90th percentile band
+
+def month_days(months, day_of_month):
+    # Dates of `day_of_month` in each month, clamped to short months; broadcasts.
+    import numpy as np
+    starts = months.astype('datetime64[D]')
+    lengths = ((months + 1).astype('datetime64[D]') - starts).astype(int)
+    return starts + (np.minimum(day_of_month, lengths) - 1)
+
+def add_monthly(flows, var, days, months, day_of_month, mean, variance, skip_first):
+    # Books one event per (series, month) on the day grid; series x months, no row loops.
+    import numpy as np
+    dates = month_days(months[None, :], day_of_month[:, None])
+    idx = (dates - days[0]).astype(int)
+    mask = (idx > 0) & (idx < len(days))
+    mask[:, 0] &= ~skip_first
+    amounts = np.broadcast_to(mean, idx.shape)[mask]
+    np.add.at(flows, idx[mask], amounts)
+    np.add.at(var, idx[mask], np.broadcast_to(variance, idx.shape)[mask])
+    return float(amounts.sum())
+
+def recurring_incomes(rows, hist_start, current_month):
+    # A description is recurring when it was paid in at least 3 of the history months,
+    # in at least half of the months since it first appeared and in one of the last two.
+    # Its expected amount and variance account for the months it was skipped.
+    import numpy as np
+    n = int(current_month - hist_start)
+    empty = np.zeros(0)
+    if not rows or n < 1: return [], empty, empty.astype(int), empty, empty, empty.astype(bool)
+    names, name_idx = np.unique(np.asarray([r['_id']['description'] for r in rows], dtype=str), return_inverse=True)
+    month_idx = (np.asarray([r['_id']['month'] for r in rows], dtype='datetime64[M]') - hist_start).astype(int)
+    amounts = np.asarray([r['amount'] for r in rows], dtype=float)
+    day = np.asarray([r['day'] for r in rows], dtype=float)
+
+    current = month_idx == n
+    received = np.zeros(len(names), dtype=bool)
+    received[name_idx[current]] = True
+    hist = ~current
+    paid = np.full((len(names), n), np.nan)
+    days = np.full((len(names), n), np.nan)
+    paid[name_idx[hist], month_idx[hist]] = amounts[hist]
+    days[name_idx[hist], month_idx[hist]] = day[hist]
+
+    present = ~np.isnan(paid)
+    count = present.sum(axis=1)
+    seen = count > 0
+    first = np.argmax(present, axis=1)
+    last = n - 1 - np.argmax(present[:, ::-1], axis=1)
+    freq = np.where(seen, count / np.maximum(n - first, 1), 0)
+    keep = (count >= 3) & (freq >= 0.5) & (last >= n - 2)
+    if not keep.any(): return [], empty, empty.astype(int), empty, empty, empty.astype(bool)
+
+    paid, days, freq = paid[keep], days[keep], freq[keep]
+    mean = np.nanmean(paid, axis=1)
+    mean_sq = np.nanvar(paid, axis=1) + mean ** 2
+    expected = freq * mean
+    variance = np.maximum(freq * mean_sq - expected ** 2, 0)
+    return names[keep].tolist(), mean, np.nanmedian(days, axis=1).astype(int), expected, variance, received[keep]
+
+def contribution_trend(rows, hist_start, current_month, months):
+    # Linear trend of monthly net contributions, clamped to the range seen in history;
+    # the residual spread becomes the per-month variance.
+    import numpy as np
+    n = int(current_month - hist_start)
+    if not rows or n < 1: return None
+    month_idx = (np.asarray([r['_id'] for r in rows], dtype='datetime64[M]') - hist_start).astype(int)
+    net = np.zeros(n + 1)
+    np.add.at(net, month_idx, np.asarray([r['net'] for r in rows], dtype=float))
+    day = int(np.median([r['day'] for r in rows]))
+    history, made_this_month = net[:n], bool((month_idx == n).any())
+    x = np.arange(n, dtype=float)
+    slope, intercept = np.polyfit(x, history, 1) if n >= 2 else (0.0, history[0])
+    residual = history - (slope * x + intercept)
+    future_x = np.arange(len(months), dtype=float) + n
+    trend = np.clip(slope * future_x + intercept, history.min(), history.max())
+    return trend, float(residual.var()), day, made_this_month
+
+def pending_invoices(flows, days, cards, charges):
+    # Maps each card charge to the due date of the invoice it falls in: closing dates of
+    # every card are laid out on one offset axis so a single searchsorted finds the cycle.
+    import numpy as np
+    if not cards or not charges: return 0.0
+    card_index = {c['_id']: i for i, c in enumerate(cards)}
+    rows = [(card_index[r['card_id']], r['date'][:10], r['amount']) for r in charges if r.get('card_id') in card_index]
+    if not rows: return 0.0
+    card_idx, dates, amounts = (np.asarray(col) for col in zip(*rows))
+    dates = dates.astype('datetime64[D]')
+    amounts = amounts.astype(float)
+
+    months = np.arange(dates.min().astype('datetime64[M]') - 1, days[-1].astype('datetime64[M]') + 2)
+    closing_day = np.asarray([c.get('closing_day') or 1 for c in cards])[:, None]
+    closing = month_days(months[None, :], closing_day)
+    # Same rule as invoice_due_date: a due day on or before the configured (unclamped)
+    # closing day falls next month.
+    due_day = np.asarray([c.get('due_day') or 0 for c in cards])[:, None]
+    due_day = np.where(due_day > 0, due_day, closing_day)
+    due = month_days(months[None, :] + (due_day <= closing_day), due_day)
+
+    span = (closing[:, -1] - closing[:, 0]).astype(int).max() + 1
+    offset = np.arange(len(cards))[:, None] * span
+    axis = ((closing - closing[:, :1]).astype(int) + offset).ravel()
+    keys = (dates - closing[card_idx, 0]).astype(int) + offset[card_idx, 0]
+    due = due.ravel()[np.searchsorted(axis, keys, side='left')]
+
+    idx = (due - days[0]).astype(int)
+    mask = (idx > 0) & (idx < len(days))
+    np.add.at(flows, idx[mask], -amounts[mask])
+    return float(amounts[mask].sum())
+
+@app.route('/api/forecast', methods=['GET'])
+@login_required
+@cached_view
+def forecast():
+    months = request.args.get('months', 12, type=int)
+    if not months or not 1 <= months <= FORECAST_MAX_MONTHS:
+        return jsonify({"error": f"months must be between 1 and {FORECAST_MAX_MONTHS}"}), 400
+    max_points = chart_points(request.args)
+    return jsonify(forecast_payload(ObjectId(current_user.id), months, max_points))
+
+def forecast_payload(user_id, months, max_points):
+    import numpy as np
+    today = datetime.now()
+    end = today + relativedelta(months=months)
+    days = np.arange(np.datetime64(today.strftime('%Y-%m-%d')), np.datetime64(end.strftime('%Y-%m-%d')) + 1)
+    current_month = days[0].astype('datetime64[M]')
+    hist_start = current_month - FORECAST_HISTORY_MONTHS
+    hist_from = str(hist_start.astype('datetime64[D]'))
+    # Invoices due from today on can still hold charges from two cycles back.
+    charges_from = (today - relativedelta(months=3)).strftime('%Y-%m-%d')
+    query = {"user_id": user_id}
+
+    res = run_concurrently({
+        "wallets": partial(aggregate_list, "wallets", [{"$match": query}, {"$group": {"_id": None, "total": {"$sum": "$balance"}}}]),
+        "cards": lambda: list(db.credit_cards.find(query, {"closing_day": 1, "due_day": 1})),
+        "charges": partial(aggregate_list, "expenses", expense_rows_pipeline({**query, "card_id": {"$ne": None}, "date": {"$gte": charges_from, "$lte": end.strftime('%Y-%m-%d')}}) + [
+            {"$project": {"_id": 0, "card_id": 1, "date": 1, "amount": 1}}
+        ]),
+        "incomes": partial(aggregate_list, "incomes", [
+            {"$match": {**query, "date": {"$gte": hist_from, "$lte": str(days[0])}}},
+            {"$group": {
+                "_id": {"description": {"$toLower": "$description"}, "month": {"$substr": ["$date", 0, 7]}},
+                "amount": {"$sum": "$amount"},
+                "day": {"$min": {"$toInt": {"$substr": ["$date", 8, 2]}}}
+            }}
+        ]),
+        "contributions": partial(aggregate_list, "investment_entries", [
+            {"$match": {**query, "date": {"$gte": hist_from, "$lte": str(days[0])}}},
+            {"$group": {
+                "_id": {"$substr": ["$date", 0, 7]},
+                "net": {"$sum": {"$cond": [{"$eq": ["$type", "withdrawal"]}, {"$multiply": ["$amount", -1]}, "$amount"]}},
+                "day": {"$min": {"$toInt": {"$substr": ["$date", 8, 2]}}}
+            }}
+        ])
+    })
+
+    start_balance = res['wallets'][0]['total'] if res['wallets'] else 0.0
+    flows = np.zeros(len(days))
+    var = np.zeros(len(days))
+    future_months = np.arange(current_month, days[-1].astype('datetime64[M]') + 1)
+
+    invoices = pending_invoices(flows, days, res['cards'], res['charges'])
+
+    names, amounts, pay_days, expected, variance, received = recurring_incomes(res['incomes'], hist_start, current_month)
+    income = add_monthly(flows, var, days, future_months, pay_days, expected[:, None], variance[:, None], received) if names else 0.0
+
+    invested = 0.0
+    trend = contribution_trend(res['contributions'], hist_start, current_month, future_months)
+    if trend:
+        monthly, residual_var, day, made_this_month = trend
+        invested = -add_monthly(flows, var, days, future_months, np.array([day]), -monthly[None, :], np.array([[residual_var]]), np.array([made_this_month]))
+
+    balance = start_balance + np.cumsum(flows)
+    spread = FORECAST_Z * np.sqrt(np.cumsum(var))
+    matrix = np.vstack([balance, balance - spread, balance + spread])
+    keep = lttb_indices(matrix, max_points)
+    matrix = np.round(matrix[:, keep], 2)
+
+    return {
+        "months": months,
+        "start_balance": round(start_balance, 2),
+        "dates": days[keep].astype(str).tolist(),
+        "balance": matrix[0].tolist(),
+        "low": matrix[1].tolist(),
+        "high": matrix[2].tolist(),
+        "totals": {"card_invoices": round(invoices, 2), "recurring_income": round(income, 2), "investments": round(invested, 2)},
+        "recurring_incomes": [
+            {"description": name, "amount": round(float(a), 2), "day": int(d), "expected": round(float(e), 2)}
+            for name, a, d, e in zip(names, amounts, pay_days, expected)
+        ]
+    }
+
+INLINE_BOOTSTRAP = os.getenv("INLINE_BOOTSTRAP", "0") == "1"
+# First page of transactions and chart width, as script.js requests them.
+INLINE_BOOTSTRAP_ARGS = {"limit": 30, "max_points": 400}
+
+def bootstrap_payload(user_id, args):
+    # Everything the dashboard's first paint needs, in one request: the plain
+    # per-user reads go out together and transactions reuse the cards read here.
+    query = {"user_id": user_id}
+    base = run_concurrently({
+        "settings": partial(settings_payload, user_id),
+        "cards": lambda: list(db.credit_cards.find(query, list_projection({}))),
+        "wallets": lambda: list(db.wallets.find(query, list_projection({}))),
+        "investments": lambda: list(db.investments.find(query, list_projection({}))),
+        "goals": lambda: list(db.goals.find(query, list_projection({})))
     })
+    card_names = {c['_id']: c['name'] for c in base['cards']}
+    transactions_args = MultiDict({"limit": args.get('limit', 30), "after": "", "count": "1"})
+    return {
+        "settings": base['settings'],
+        "years": years_payload(user_id),
+        "cards": [serialize_doc(c) for c in base['cards']],
+        "dashboard": dashboard_payload(user_id, args),
+        "transactions": transactions_payload(user_id, transactions_args, card_names),
+        "wallets": [serialize_doc(w) for w in base['wallets']],
+        "investments": [serialize_doc(i) for i in base['investments']],
+        "goals": [serialize_doc(g) for g in base['goals']]
+    }
+
+@app.route('/api/bootstrap', methods=['GET'])
+@login_required
+@cached_view
+def bootstrap():
+    return jsonify(bootstrap_payload(ObjectId(current_user.id), request.args))
 
 @app.route('/api/wallets', methods=['GET', 'POST'])
 @app.route('/api/wallets/<wallet_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def wallets(wallet_id=None):
     if request.method == 'DELETE':
         db.wallets.delete_one({"_id": ObjectId(wallet_id), "user_id": ObjectId(current_user.id)})
@@ -412,23 +2217,17 @@ def wallets(wallet_id=None):
         return jsonify({"status": "updated"})
 
     if request.method == 'POST':
-        data = request.json
-        new_wallet = {
-            "user_id": ObjectId(current_user.id),
-            "name": data['name'],
-            "balance": float(data['balance']),
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
+        new_wallet = wallet_doc(ObjectId(current_user.id), request.json)
         res = db.wallets.insert_one(new_wallet)
         new_wallet['_id'] = res.inserted_id
         return jsonify(serialize_doc(new_wallet))
 
-    wallets = list(db.wallets.find({"user_id": ObjectId(current_user.id)}))
+    wallets = list(db.wallets.find({"user_id": ObjectId(current_user.id)}, list_projection(request.args)))
     return jsonify([serialize_doc(w) for w in wallets])
 
 @app.route('/api/cards', methods=['GET', 'POST'])
 @login_required
+@cached_view
 def cards():
     if request.method == 'POST':
         data = request.json
@@ -444,28 +2243,21 @@ def cards():
         res = db.credit_cards.insert_one(new_card)
         new_card['_id'] = res.inserted_id
         return jsonify(serialize_doc(new_card))
-    cards = list(db.credit_cards.find({"user_id": ObjectId(current_user.id)}))
+    cards = list(db.credit_cards.find({"user_id": ObjectId(current_user.id)}, list_projection(request.args)))
     return jsonify([serialize_doc(c) for c in cards])
 
 @app.route('/api/cards/<card_id>/invoice', methods=['GET'])
 @login_required
+@cached_view
 def card_invoice(card_id):
     ref_month_str = request.args.get('month') 
     if not ref_month_str: return jsonify({"error": "Month required"}), 400
     card = db.credit_cards.find_one({"_id": ObjectId(card_id), "user_id": ObjectId(current_user.id)})
     if not card: return jsonify({"error": "Card not found"}), 404
     
-    closing_day = card.get('closing_day', 1)
-    ref_date = datetime.strptime(ref_month_str, '%Y-%m')
-    end_date = ref_date.replace(day=closing_day)
-    start_date = (end_date - relativedelta(months=1)) + timedelta(days=1)
-    
-    query = {
-        "user_id": ObjectId(current_user.id),
-        "card_id": ObjectId(card_id),
-        "date": {"$gte": start_date.strftime('%Y-%m-%d'), "$lte": end_date.strftime('%Y-%m-%d')}
-    }
-    expenses = list(db.expenses.find(query).sort("date", -1))
+    start_date, end_date = invoice_period(card, ref_month_str)
+    query = invoice_query(card, start_date, end_date)
+    expenses = attach_card_names(aggregate_list("expenses", expense_rows_pipeline(query) + [{"$sort": {"date": -1}}, {"$project": list_projection(request.args, required=("amount", "buyer"))}]), ObjectId(current_user.id), {card['_id']: card['name']})
     
     buyers_summary = {}
     total_amount = 0
@@ -483,12 +2275,38 @@ def card_invoice(card_id):
         "expenses": [serialize_doc(e, 'micro') for e in expenses]
     })
 
+@app.route('/api/cards/<card_id>/invoices', methods=['GET'])
+@login_required
+@cached_view
+def card_invoice_history(card_id):
+    months = invoice_months(request.args)
+    if not months: return jsonify({"error": "Invalid month range"}), 400
+    card = db.credit_cards.find_one({"_id": ObjectId(card_id), "user_id": ObjectId(current_user.id)})
+    if not card: return jsonify({"error": "Card not found"}), 404
+
+    invoices = card_invoices(ObjectId(current_user.id), [card], months)[card['_id']]
+    return jsonify({"card": serialize_doc(card), "invoices": invoices})
+
+@app.route('/api/cards/invoices', methods=['GET'])
+@login_required
+@cached_view
+def all_card_invoices():
+    months = invoice_months(request.args)
+    if not months: return jsonify({"error": "Invalid month range"}), 400
+    cards = list(db.credit_cards.find({"user_id": ObjectId(current_user.id)}))
+    if not cards: return jsonify([])
+
+    invoices = card_invoices(ObjectId(current_user.id), cards, months)
+    return jsonify([{"invoices": invoices[c['_id']], "card": serialize_doc(c)} for c in cards])
+
 @app.route('/api/incomes', methods=['GET', 'POST'])
 @app.route('/api/incomes/<income_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def incomes(income_id=None):
     if request.method == 'DELETE':
-        db.incomes.delete_one({"_id": ObjectId(income_id), "user_id": ObjectId(current_user.id)})
+        old = db.incomes.find_one_and_delete({"_id": ObjectId(income_id), "user_id": ObjectId(current_user.id)})
+        apply_rollup_deltas('income', removed=[old])
         return jsonify({"status": "deleted"})
 
     if request.method == 'PUT':
@@ -496,41 +2314,38 @@ def incomes(income_id=None):
         update_data = {
             "description": data['description'],
             "amount": float(data['amount']),
-            "date": data['date']
+            "date": data['date'],
+            "date_dt": to_date(data['date'])
         }
-        db.incomes.update_one({"_id": ObjectId(income_id), "user_id": ObjectId(current_user.id)}, {"$set": update_data})
+        old = db.incomes.find_one_and_update(
+            {"_id": ObjectId(income_id), "user_id": ObjectId(current_user.id)},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if old: apply_rollup_deltas('income', removed=[old], added=[{**old, **update_data}])
         return jsonify({"status": "updated"})
 
     if request.method == 'POST':
         data = request.json
-        new_income = {
-            "user_id": ObjectId(current_user.id),
-            "description": data['description'],
-            "amount": float(data['amount']),
-            "date": data['date'],
-            "created_at": datetime.utcnow()
-        }
+        new_income = income_doc(ObjectId(current_user.id), data)
         res = db.incomes.insert_one(new_income)
         new_income['_id'] = res.inserted_id
+        apply_rollup_deltas('income', added=[new_income])
         return jsonify([serialize_doc(new_income)])
     
-    query = {"user_id": ObjectId(current_user.id)}
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    if start_date or end_date:
-        query["date"] = {}
-        if start_date: query["date"]["$gte"] = start_date
-        if end_date: query["date"]["$lte"] = end_date
+    query = date_range_query(ObjectId(current_user.id), request.args)
 
-    incomes = list(db.incomes.find(query).sort("date", -1))
+    incomes = list(db.incomes.find(query, list_projection(request.args)).sort("date", -1))
     return jsonify([serialize_doc(i) for i in incomes])
 
 @app.route('/api/macro-expenses', methods=['GET', 'POST'])
 @app.route('/api/macro-expenses/<expense_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def macro_expenses(expense_id=None):
     if request.method == 'DELETE':
-        db.macro_expenses.delete_one({"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)})
+        old = db.macro_expenses.find_one_and_delete({"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)})
+        apply_rollup_deltas('expense', removed=[old])
         return jsonify({"status": "deleted"})
 
     if request.method == 'PUT':
@@ -541,52 +2356,66 @@ def macro_expenses(expense_id=None):
             "amount": float(data['amount']),
             "category": data.get('category', 'General'),
             "date": data['date'],
+            "date_dt": to_date(data['date']),
             "payment_method": data.get('payment_method', 'debit'),
             "card_id": ObjectId(card_id) if card_id else None
         }
-        db.macro_expenses.update_one({"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)}, {"$set": update_data})
+        old = db.macro_expenses.find_one_and_update(
+            {"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if old: apply_rollup_deltas('expense', removed=[old], added=[{**old, **update_data}])
         return jsonify({"status": "updated"})
 
     if request.method == 'POST':
         data = request.json
-        card_id = data.get('card_id')
-        new_expense = {
-            "user_id": ObjectId(current_user.id),
-            "description": data['description'],
-            "amount": float(data['amount']),
-            "category": data.get('category', 'General'),
-            "date": data['date'],
-            "payment_method": data.get('payment_method', 'debit'),
-            "card_id": ObjectId(card_id) if card_id else None,
-            "is_consolidated": True,
-            "created_at": datetime.utcnow()
-        }
+        new_expense = macro_expense_doc(ObjectId(current_user.id), data)
         res = db.macro_expenses.insert_one(new_expense)
         new_expense['_id'] = res.inserted_id
+        apply_rollup_deltas('expense', added=[new_expense])
         return jsonify([serialize_doc(new_expense, 'macro')])
 
-    query = {"user_id": ObjectId(current_user.id)}
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    if start_date or end_date:
-        query["date"] = {}
-        if start_date: query["date"]["$gte"] = start_date
-        if end_date: query["date"]["$lte"] = end_date
+    query = date_range_query(ObjectId(current_user.id), request.args)
 
-    expenses = list(db.macro_expenses.find(query).sort("date", -1))
-    for expense in expenses:
-        if expense.get('card_id'):
-            card = db.credit_cards.find_one({"_id": expense['card_id']})
-            if card: expense['card_name'] = card['name']
-            
+    expenses = attach_card_names(list(db.macro_expenses.find(query, list_projection(request.args)).sort("date", -1)), ObjectId(current_user.id))
     return jsonify([serialize_doc(e, 'macro') for e in expenses])
 
 @app.route('/api/expenses', methods=['GET', 'POST'])
 @app.route('/api/expenses/<expense_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def expenses(expense_id=None):
+    user_id = ObjectId(current_user.id)
+    plan_scope = request.args.get('scope') == 'plan'
+    virtual_plan_id, installment_index = split_virtual_id(expense_id)
+    plan_id, plan, expense = None, None, None
+    if virtual_plan_id:
+        plan = db.installment_plans.find_one({"_id": virtual_plan_id, "user_id": user_id})
+        if not plan or not 1 <= installment_index <= len(plan['schedule']) or not plan['schedule'][installment_index - 1]:
+            return jsonify({"error": "Expense not found"}), 404
+        if plan_scope: plan_id = virtual_plan_id
+    elif expense_id and plan_scope:
+        expense = db.expenses.find_one({"_id": ObjectId(expense_id), "user_id": user_id}, {"plan_id": 1, "card_id": 1})
+        plan_id = expense.get('plan_id') if expense else None
+        if plan_id: plan = db.installment_plans.find_one({"_id": plan_id, "user_id": user_id})
+    old_card_id = (plan or expense or {}).get('card_id')
+
     if request.method == 'DELETE':
-        db.expenses.delete_one({"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)})
+        if plan_id:
+            res = db.expenses.delete_many({"plan_id": plan_id, "user_id": user_id})
+            deleted = res.deleted_count
+            if plan:
+                db.installment_plans.delete_one({"_id": plan_id})
+                deleted += sum(1 for d in plan['schedule'] if d)
+            invalidate_statements(user_id, [old_card_id])
+            return jsonify({"status": "deleted", "deleted": deleted})
+        if virtual_plan_id:
+            db.installment_plans.update_one({"_id": virtual_plan_id}, {"$set": {f"schedule.{installment_index - 1}": None}})
+            invalidate_statements(user_id, [old_card_id], plan['schedule'][installment_index - 1])
+            return jsonify({"status": "deleted"})
+        old = db.expenses.find_one_and_delete({"_id": ObjectId(expense_id), "user_id": user_id})
+        if old: invalidate_statements(user_id, [old.get('card_id')], old['date'])
         return jsonify({"status": "deleted"})
 
     if request.method == 'PUT':
@@ -597,6 +2426,7 @@ def expenses(expense_id=None):
             "amount": float(data['amount']),
             "category": data.get('category', 'General'),
             "date": data['date'],
+            "date_dt": to_date(data['date']),
             "establishment": data.get('establishment'),
             "buyer": data.get('buyer'),
             "payment_method": data.get('payment_method'),
@@ -604,104 +2434,594 @@ def expenses(expense_id=None):
             "installments": data.get('installments'),
             "observation": data.get('observation')
         }
-        db.expenses.update_one({"_id": ObjectId(expense_id), "user_id": ObjectId(current_user.id)}, {"$set": update_data})
+        update_data["search_tokens"] = search_tokens(*(update_data[f] for f in SEARCH_FIELDS))
+        if plan_id:
+            plan_data = {k: update_data[k] for k in PLAN_SHARED_FIELDS + ("search_tokens",)}
+            res = db.expenses.update_many({"plan_id": plan_id, "user_id": user_id}, {"$set": plan_data})
+            updated = res.matched_count
+            if plan:
+                db.installment_plans.update_one({"_id": plan_id}, {"$set": plan_data})
+                updated += sum(1 for d in plan['schedule'] if d)
+            invalidate_statements(user_id, [old_card_id, update_data['card_id']])
+            return jsonify({"status": "updated", "updated": updated})
+        if virtual_plan_id:
+            # Editing a single installment detaches it from the plan into a regular expense.
+            old_date = plan['schedule'][installment_index - 1]
+            db.expenses.insert_one({
+                **update_data, "user_id": user_id, "plan_id": virtual_plan_id, "installment_index": installment_index,
+                "is_consolidated": False, "created_at": datetime.utcnow()
+            })
+            db.installment_plans.update_one({"_id": virtual_plan_id}, {"$set": {f"schedule.{installment_index - 1}": None}})
+            invalidate_statements(user_id, [old_card_id, update_data['card_id']], min(old_date, update_data['date']))
+            return jsonify({"status": "updated"})
+        old = db.expenses.find_one_and_update({"_id": ObjectId(expense_id), "user_id": user_id}, {"$set": update_data})
+        if old: invalidate_statements(user_id, [old.get('card_id'), update_data['card_id']], min(old['date'], update_data['date']))
         return jsonify({"status": "updated"})
 
     if request.method == 'POST':
         data = request.json
-        installments_str = data.get('installments')
-        base_date = datetime.strptime(data['date'], '%Y-%m-%d')
-        
-        match = re.match(r'(\d+)/(\d+)', str(installments_str))
+        match = re.match(r'(\d+)/(\d+)', str(data.get('installments')))
         
         if match:
-            current_inst = int(match.group(1))
-            total_inst = int(match.group(2))
-            
-            for i in range(1, total_inst + 1):
-                month_offset = i - current_inst
-                inst_date = base_date + relativedelta(months=month_offset)
-                inst_date_str = inst_date.strftime('%Y-%m-%d')
-                inst_label = f"{i}/{total_inst}"
-                
-                exists = db.expenses.find_one({
-                    "user_id": ObjectId(current_user.id),
-                    "description": data['description'],
-                    "amount": float(data['amount']),
-                    "installments": inst_label
-                })
-                
-                if not exists:
-                    obs = data.get('observation', '')
-                    if i != current_inst: obs = f"[Gerado Auto] {obs}".strip()
-                    
-                    new_expense = {
-                        "user_id": ObjectId(current_user.id),
-                        "description": data['description'],
-                        "amount": float(data['amount']),
-                        "category": data.get('category', 'General'),
-                        "date": inst_date_str,
-                        "establishment": data.get('establishment'),
-                        "buyer": data.get('buyer'),
-                        "payment_method": data.get('payment_method'),
-                        "card_id": ObjectId(data.get('card_id')) if data.get('card_id') else None,
-                        "installments": inst_label,
-                        "observation": obs,
-                        "is_consolidated": False,
-                        "created_at": datetime.utcnow()
-                    }
-                    db.expenses.insert_one(new_expense)
-            return jsonify({"status": "success", "message": "Parcelas geradas"})
+            new_plan = installment_plan_doc(user_id, data, int(match.group(1)), int(match.group(2)))
+            db.installment_plans.update_one({"_id": new_plan['_id']}, {"$setOnInsert": {k: v for k, v in new_plan.items() if k != '_id'}}, upsert=True)
+            invalidate_statements(user_id, [new_plan['card_id']], new_plan['schedule'][0])
+
+            created = db.installment_plans.aggregate(plan_rows_pipeline({"user_id": user_id, "plan_id": new_plan['_id']}))
+            return jsonify([serialize_doc(e, 'micro') for e in created])
         
         else:
-            new_expense = {
-                "user_id": ObjectId(current_user.id),
-                "description": data['description'],
-                "amount": float(data['amount']),
-                "category": data.get('category', 'General'),
-                "date": data['date'],
-                "establishment": data.get('establishment'),
-                "buyer": data.get('buyer'),
-                "payment_method": data.get('payment_method'),
-                "card_id": ObjectId(data.get('card_id')) if data.get('card_id') else None,
-                "installments": data.get('installments'),
-                "observation": data.get('observation'),
-                "is_consolidated": False,
-                "created_at": datetime.utcnow()
-            }
+            new_expense = expense_doc(user_id, data)
             res = db.expenses.insert_one(new_expense)
             new_expense['_id'] = res.inserted_id
+            invalidate_statements(user_id, [new_expense['card_id']], new_expense['date'])
             return jsonify([serialize_doc(new_expense, 'micro')])
             
-    query = {"user_id": ObjectId(current_user.id)}
-    
-    search_term = request.args.get('search')
-    if search_term:
-        regex = re.compile(search_term, re.IGNORECASE)
-        query["$or"] = [{"description": regex}, {"establishment": regex}, {"category": regex}, {"buyer": regex}]
-    
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    if start_date or end_date:
-        query["date"] = {}
-        if start_date: query["date"]["$gte"] = start_date
-        if end_date: query["date"]["$lte"] = end_date
-
-    expenses = list(db.expenses.find(query).sort("date", -1))
-    for expense in expenses:
-        if expense.get('card_id'):
-            card = db.credit_cards.find_one({"_id": expense['card_id']})
-            if card: expense['card_name'] = card['name']
-            
+    query, terms = expense_search_query(user_id, request.args)
+    pipeline = expense_rows_pipeline(query)
+    if terms:
+        limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), SEARCH_LIMIT))
+        pipeline += [
+            {"$addFields": {"search_score": {"$size": {"$filter": {"input": terms, "cond": {"$in": ["$$this", "$search_tokens"]}}}}}},
+            {"$sort": {"search_score": -1, "date": -1}},
+            {"$limit": limit}
+        ]
+    else:
+        pipeline.append({"$sort": {"date": -1}})
+    pipeline.append({"$project": list_projection(request.args)})
+    expenses = attach_card_names(aggregate_list("expenses", pipeline), user_id)
     return jsonify([serialize_doc(e, 'micro') for e in expenses])
 
+BATCH_MAX_OPERATIONS = 1000
+BATCH_MAX_MATCHES = 10000
+BATCH_DOCS = {"expenses": expense_doc, "macro_expenses": macro_expense_doc, "incomes": income_doc, "wallets": wallet_doc, "goals": goal_doc}
+BATCH_FIELDS = {
+    "expenses": ("description", "amount", "category", "date", "establishment", "buyer", "payment_method", "card_id", "installments", "observation"),
+    "macro_expenses": ("description", "amount", "category", "date", "payment_method", "card_id"),
+    "incomes": ("description", "amount", "date"),
+    "wallets": ("name", "balance"),
+    "goals": ("title", "type", "target_amount", "current_amount", "deadline")
+}
+BATCH_FILTERS = {
+    "expenses": ("search", "start_date", "end_date", "category", "card_id"),
+    "macro_expenses": ("start_date", "end_date", "category", "card_id"),
+    "incomes": ("start_date", "end_date")
+}
+BATCH_NUMBER_FIELDS = ("amount", "balance", "target_amount", "current_amount")
+
+class BatchError(ValueError):
+    pass
+
+def batch_update(coll_name, data):
+    if not isinstance(data, dict) or not data: raise BatchError("data must be a non-empty object")
+    unknown = sorted(set(data) - set(BATCH_FIELDS[coll_name]))
+    if unknown: raise BatchError(f"Unknown fields: {', '.join(unknown)}")
+    update = {}
+    for field, value in data.items():
+        if field in BATCH_NUMBER_FIELDS: value = float(value)
+        elif field == 'card_id': value = ObjectId(value) if value else None
+        update[field] = value
+    if 'date' in update: update['date_dt'] = to_date(update['date'])
+    if coll_name == 'wallets': update['updated_at'] = datetime.utcnow()
+    return update
+
+def batch_filter_rows(coll_name, user_id, spec):
+    if coll_name not in BATCH_FILTERS: raise BatchError(f"Filters are not supported on {coll_name}")
+    if not isinstance(spec, dict) or not spec: raise BatchError("filter must be a non-empty object")
+    unknown = sorted(set(spec) - set(BATCH_FILTERS[coll_name]))
+    if unknown: raise BatchError(f"Unknown filters: {', '.join(unknown)}")
+    query = expense_search_query(user_id, spec)[0] if coll_name == 'expenses' else date_range_query(user_id, spec)
+    if 'category' in spec: query["category"] = spec['category']
+    if 'card_id' in spec: query["card_id"] = ObjectId(spec['card_id']) if spec['card_id'] else None
+    if coll_name == 'expenses':
+        rows = aggregate_list("expenses", expense_rows_pipeline(query) + [{"$limit": BATCH_MAX_MATCHES + 1}])
+    else:
+        rows = list(db[coll_name].find(query).limit(BATCH_MAX_MATCHES + 1))
+    if len(rows) > BATCH_MAX_MATCHES: raise BatchError(f"Filter matches more than {BATCH_MAX_MATCHES} rows")
+    return rows
+
+def batch_rows(user_id, operations):
+    # Every row referenced by id, fetched up front with one query per collection
+    # (plus one for virtual installment rows), keyed like the rows' `_id`.
+    ids = {}
+    for op in operations:
+        if isinstance(op, dict) and op.get('collection') in BATCH_FIELDS and isinstance(op.get('id'), str):
+            ids.setdefault(op['collection'], set()).add(op['id'])
+    rows = {coll_name: {} for coll_name in BATCH_FIELDS}
+    for coll_name, values in ids.items():
+        virtual = [v for v in values if coll_name == 'expenses' and split_virtual_id(v)[0]]
+        real = [ObjectId(v) for v in values if ObjectId.is_valid(v)]
+        if real:
+            rows[coll_name].update((d['_id'], d) for d in db[coll_name].find({"_id": {"$in": real}, "user_id": user_id}))
+        if virtual:
+            query = {"user_id": user_id, "plan_id": {"$in": list({split_virtual_id(v)[0] for v in virtual})}, "_id": {"$in": virtual}}
+            rows[coll_name].update((d['_id'], d) for d in db.installment_plans.aggregate(plan_rows_pipeline(query)))
+    return rows
+
+def batch_row_key(coll_name, value):
+    if not isinstance(value, str): raise BatchError("id must be a string")
+    if coll_name == 'expenses' and split_virtual_id(value)[0]: return value
+    return ObjectId(value)
+
+def batch_row_writes(coll_name, user_id, old, update, touched):
+    # Writes that update (or, with update=None, delete) one existing row, each
+    # tagged with its rollup delta. Returns the row's new state and the id of the
+    # row the change landed on.
+    kind = ROLLUP_KINDS.get(coll_name)
+    new = None
+    if update is not None:
+        new = {**old, **update}
+        if coll_name == 'expenses': new['search_tokens'] = search_tokens(*(new.get(f) for f in SEARCH_FIELDS))
+    if coll_name == 'expenses':
+        touched.append((old.get('card_id'), old['date']))
+        if new: touched.append((new.get('card_id'), new['date']))
+
+    if isinstance(old['_id'], str):
+        # Same as the single-row routes: a virtual installment is deleted by
+        # nulling its schedule slot and edited by detaching it into a real row.
+        plan_id, index = split_virtual_id(old['_id'])
+        writes = [("installment_plans", UpdateOne({"_id": plan_id, "user_id": user_id}, {"$set": {f"schedule.{index - 1}": None}}), None)]
+        if not new: return writes, None, old['_id']
+        detached = {k: v for k, v in new.items() if k != '_id'}
+        detached.update({"_id": ObjectId(), "date_dt": to_date(new['date']), "created_at": datetime.utcnow()})
+        writes.append(("expenses", InsertOne(detached), None))
+        return writes, None, detached['_id']
+
+    if new is None:
+        return [(coll_name, DeleteOne({"_id": old['_id'], "user_id": user_id}), kind and (kind, [old], []))], None, old['_id']
+    fields = {k: new[k] for k in update}
+    if coll_name == 'expenses': fields['search_tokens'] = new['search_tokens']
+    return [(coll_name, UpdateOne({"_id": old['_id'], "user_id": user_id}, {"$set": fields}), kind and (kind, [old], [new]))], new, old['_id']
+
+def plan_batch_operation(user_id, op, rows, touched):
+    # Validates one operation against the rows as the batch left them so far and
+    # returns (result, writes); nothing is written here.
+    if not isinstance(op, dict): raise BatchError("operation must be an object")
+    action, coll_name = op.get('op'), op.get('collection')
+    if coll_name not in BATCH_FIELDS: raise BatchError(f"Unsupported collection: {coll_name}")
+    state = rows[coll_name]
+
+    if action == 'insert':
+        data = op.get('data')
+        if not isinstance(data, dict): raise BatchError("data must be an object")
+        match = re.match(r'(\d+)/(\d+)', str(data.get('installments'))) if coll_name == 'expenses' else None
+        if match:
+            plan = installment_plan_doc(user_id, data, int(match.group(1)), int(match.group(2)))
+            touched.append((plan['card_id'], plan['schedule'][0]))
+            write = UpdateOne({"_id": plan['_id']}, {"$setOnInsert": {k: v for k, v in plan.items() if k != '_id'}}, upsert=True)
+            return {"status": "inserted", "_id": plan['_id']}, [("installment_plans", write, None)]
+        doc = BATCH_DOCS[coll_name](user_id, data)
+        doc['_id'] = ObjectId()
+        if coll_name == 'expenses': touched.append((doc['card_id'], doc['date']))
+        kind = ROLLUP_KINDS.get(coll_name)
+        return {"status": "inserted", "_id": str(doc['_id'])}, [(coll_name, InsertOne(doc), kind and (kind, [], [doc]))]
+
+    if action in ('update', 'delete'):
+        update = batch_update(coll_name, op.get('data')) if action == 'update' else None
+        key = batch_row_key(coll_name, op.get('id'))
+        old = state.get(key)
+        if old is None: return {"status": "not_found"}, []
+        writes, state[key], row_id = batch_row_writes(coll_name, user_id, old, update, touched)
+        return {"status": "updated" if update else "deleted", "_id": str(row_id)}, writes
+
+    if action in ('update_many', 'delete_many'):
+        update = batch_update(coll_name, op.get('data')) if action == 'update_many' else None
+        writes, count = [], 0
+        for row in batch_filter_rows(coll_name, user_id, op.get('filter')):
+            # Rows already deleted or edited earlier in the batch use that state.
+            old = state[row['_id']] if row['_id'] in state else row
+            if old is None: continue
+            row_writes, state[row['_id']], _ = batch_row_writes(coll_name, user_id, old, update, touched)
+            writes += row_writes
+            count += 1
+        return {"status": "updated" if update else "deleted", "count": count}, writes
+
+    raise BatchError(f"Unsupported op: {action}")
+
+def write_batch(writes, session=None):
+    # One bulk_write per collection; returns {write index: error} for rows the
+    # server rejected. Inside a transaction any failure aborts everything.
+    groups = {}
+    for i, (coll_name, _, _) in enumerate(writes): groups.setdefault(coll_name, []).append(i)
+    failed = {}
+    for coll_name, indices in groups.items():
+        try:
+            db[coll_name].bulk_write([writes[i][1] for i in indices], ordered=False, session=session)
+        except BulkWriteError as e:
+            if session is not None: raise
+            for err in e.details.get('writeErrors', []): failed[indices[err['index']]] = err.get('errmsg')
+    return failed
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def batch():
+    data = request.json or {}
+    operations = data.get('operations')
+    atomic = bool(data.get('atomic'))
+    if not isinstance(operations, list) or not operations: return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS: return jsonify({"error": f"At most {BATCH_MAX_OPERATIONS} operations per batch"}), 400
+
+    user_id = ObjectId(current_user.id)
+    rows = batch_rows(user_id, operations)
+    results, writes, owners, touched = [], [], [], []
+    for index, op in enumerate(operations):
+        try:
+            result, op_writes = plan_batch_operation(user_id, op, rows, touched)
+        except KeyError as e:
+            result, op_writes = {"status": "error", "error": f"Missing field: {e.args[0]}"}, []
+        except (ValueError, TypeError, bson.errors.InvalidId) as e:
+            result, op_writes = {"status": "error", "error": str(e)}, []
+        results.append({"index": index, **result})
+        writes += op_writes
+        owners += [index] * len(op_writes)
+
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if atomic and errors:
+        results = [r if r['status'] == 'error' else {"index": r['index'], "status": "skipped"} for r in results]
+        return jsonify({"results": results, "errors": errors}), 400
+
+    response = {}
+    if atomic:
+        try:
+            failed = run_transaction(partial(write_batch, writes))
+        except TransactionsUnavailable:
+            # Without a transaction a failure partway would leave part of the batch
+            # written, so an all-or-nothing request is refused rather than downgraded.
+            return jsonify({"error": "Atomic batches need a MongoDB replica set; nothing was written",
+                            "results": [{"index": r['index'], "status": "skipped"} for r in results]}), 409
+        except BulkWriteError as e:
+            message = (e.details.get('writeErrors') or [{}])[0].get('errmsg', str(e))
+            return jsonify({"error": f"Batch rolled back: {message}", "results": [{"index": r['index'], "status": "error"} for r in results]}), 409
+        response["transaction"] = True
+    else:
+        failed = write_batch(writes) if writes else {}
+
+    for i, message in failed.items():
+        result = results[owners[i]]
+        result['failed'] = result.get('failed', 0) + 1
+        result['status'], result['error'] = 'error', message
+        if 'count' in result: result['count'] -= 1
+
+    deltas = {}
+    for i, (_, _, rollup) in enumerate(writes):
+        if rollup and i not in failed:
+            removed, added = deltas.setdefault(rollup[0], ([], []))
+            removed += rollup[1]
+            added += rollup[2]
+    for kind, (removed, added) in deltas.items(): apply_rollup_deltas(kind, removed=removed, added=added)
+    if touched: invalidate_statements(user_id, list({card_id for card_id, _ in touched}), min(date for _, date in touched))
+
+    response.update({"results": results, "errors": sum(1 for r in results if r['status'] == 'error')})
+    return jsonify(response)
+
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_FIELDS = {
+    "expenses": ["date", "description", "amount", "category", "establishment", "buyer", "payment_method", "card_name", "installments", "observation"],
+    "macro_expenses": ["date", "description", "amount", "category", "payment_method", "card_name"],
+    "incomes": ["date", "description", "amount"],
+    "investment_entries": ["date", "investment_id", "type", "amount"]
+}
+EXPORT_FIELDS["invoice"] = EXPORT_FIELDS["expenses"]
+
+def export_chunks(cursor, fmt, fields, prepare):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer: writer.writerow(fields)
+
+    for count, doc in enumerate(cursor, 1):
+        doc = prepare(doc)
+        if writer: writer.writerow(["" if doc.get(f) is None else doc.get(f) for f in fields])
+        else: buffer.write(app.json.dumps(doc) + "\n")
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route('/api/export/<collection>', methods=['GET'])
+@login_required
+def export_collection(collection):
+    fmt = request.args.get('format', 'ndjson')
+    if collection not in EXPORT_FIELDS or fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "Unsupported export"}), 400
+
+    user_id = ObjectId(current_user.id)
+    # CSV columns are fixed by EXPORT_FIELDS; NDJSON rows honour ?fields= like the list endpoints.
+    projection = list_projection(request.args if fmt == 'ndjson' else {})
+    source = None
+    if collection == 'invoice':
+        ref_month_str = request.args.get('month')
+        if not ref_month_str: return jsonify({"error": "Month required"}), 400
+        if not ObjectId.is_valid(request.args.get('card_id', '')): return jsonify({"error": "Valid card_id required"}), 400
+        card = db.credit_cards.find_one({"_id": ObjectId(request.args['card_id']), "user_id": user_id})
+        if not card: return jsonify({"error": "Card not found"}), 404
+        start_date, end_date = invoice_period(card, ref_month_str)
+        pipeline = expense_rows_pipeline(invoice_query(card, start_date, end_date)) + [{"$sort": {"date": -1}}, {"$project": projection}]
+        cursor = db.expenses.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE)
+        source = 'micro'
+    elif collection == 'expenses':
+        pipeline = expense_rows_pipeline(expense_search_query(user_id, request.args)[0]) + [{"$sort": {"date": -1}}, {"$project": projection}]
+        cursor = db.expenses.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE)
+        source = 'micro'
+    else:
+        query = date_range_query(user_id, request.args)
+        if collection == 'investment_entries' and request.args.get('investment_id'):
+            if not ObjectId.is_valid(request.args['investment_id']): return jsonify({"error": "Invalid investment_id"}), 400
+            query["investment_id"] = ObjectId(request.args['investment_id'])
+        cursor = db[collection].find(query, projection).sort("date", -1)
+        if collection == 'macro_expenses': source = 'macro'
+
+    names = {c['_id']: c['name'] for c in db.credit_cards.find({"user_id": user_id}, {"name": 1})}
+    def prepare(doc): return serialize_doc(attach_card_names([doc], user_id, names)[0], source)
+
+    cursor = cursor.batch_size(EXPORT_BATCH_SIZE)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{collection}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return Response(
+        stream_with_context(export_chunks(cursor, fmt, EXPORT_FIELDS[collection], prepare)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+IMPORT_TARGETS = {"expenses": expense_doc, "macro_expenses": macro_expense_doc, "incomes": income_doc}
+OFX_TAG_RE = re.compile(r'<(/?)(\w+)>([^<\r\n]*)')
+
+def parse_statement_date(value):
+    value = value.strip()
+    for fmt, size in (('%Y-%m-%d', 10), ('%d/%m/%Y', 10), ('%Y%m%d', 8)):
+        try:
+            return datetime.strptime(value[:size], fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date {value!r}")
+
+DECIMAL_SEPARATORS = (',', '.')
+AMOUNT_RES = {
+    decimal: re.compile(rf'^[-+]?(\d+|\d{{1,3}}(\{grouping}\d{{3}})+)(\{decimal}\d+)?$')
+    for decimal, grouping in ((',', '.'), ('.', ','))
+}
+# One separator followed by exactly three digits: 1.234 is 1234 in pt-BR and 1.234 in en-US.
+AMBIGUOUS_AMOUNT_RE = re.compile(r'^[-+]?[1-9]\d{0,2}[.,]\d{3}$')
+# Direction of (negative, positive) amounts: bank statements and OFX count money out
+# as negative, card statements list charges as positive and refunds as negative.
+AMOUNT_SIGNS = {"bank": ("debit", "credit"), "card": ("credit", "debit")}
+
+def parse_statement_amount(value, decimal=None):
+    if isinstance(value, (int, float)): return float(value)
+    text = str(value).strip().replace('R$', '').replace(' ', '')
+    if decimal is None:
+        if ',' in text and '.' in text:
+            decimal = ',' if text.rfind(',') > text.rfind('.') else '.'
+        elif AMBIGUOUS_AMOUNT_RE.match(text):
+            raise ValueError(f"ambiguous amount {value!r}, set the decimal separator")
+        elif text.count(',') + text.count('.') > 1:
+            # A repeated separator can only be grouping: 1.234.567
+            decimal = '.' if ',' in text else ','
+        else:
+            decimal = ',' if ',' in text else '.'
+    if not AMOUNT_RES[decimal].match(text): raise ValueError(f"invalid amount {value!r}")
+    return float(text.replace('.' if decimal == ',' else ',', '').replace(decimal, '.'))
+
+def amount_direction(amount, sign):
+    if not amount: return None
+    return AMOUNT_SIGNS[sign][0 if amount < 0 else 1]
+
+def parse_mapping(raw):
+    try:
+        mapping = json.loads(raw)
+    except ValueError:
+        mapping = None
+    if not isinstance(mapping, dict) or not all(isinstance(v, str) for v in mapping.values()):
+        raise ValueError("Mapping must be a JSON object of field to column names")
+    return mapping
+
+def csv_records(stream, mapping=None):
+    # Sniff eagerly so an unreadable header is rejected before the import starts.
+    header = stream.readline()
+    if not header: return iter(())
+    try:
+        dialect = csv.Sniffer().sniff(header, delimiters=',;\t')
+    except csv.Error:
+        raise ValueError("Could not detect the CSV delimiter from the header row")
+    return csv_rows(itertools.chain([header], stream), dialect, mapping)
+
+def csv_rows(lines, dialect, mapping):
+    reader = csv.DictReader(lines, dialect=dialect)
+    reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+    columns = {field: column.strip().lower() for field, column in (mapping or {}).items()}
+    for raw in reader:
+        row = {k: v for k, v in raw.items() if k}
+        for field, column in columns.items(): row[field] = raw.get(column)
+        yield reader.line_num, row
+
+def ofx_records(stream):
+    count, current = 0, None
+    for line in stream:
+        for closing, tag, value in OFX_TAG_RE.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {}
+                elif current is not None:
+                    count += 1
+                    # OFX amounts are signed like bank statements and never grouped.
+                    trnamt = current.get('TRNAMT', '')
+                    amount = parse_statement_amount(trnamt, ',' if ',' in trnamt else '.')
+                    yield count, {
+                        "date": current.get('DTPOSTED', ''),
+                        "amount": abs(amount),
+                        "direction": "credit" if amount > 0 else "debit",
+                        "description": current.get('MEMO') or current.get('NAME'),
+                        "establishment": current.get('NAME'),
+                        "fitid": current.get('FITID')
+                    }
+                    current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+def statement_row_data(target, row, cards, default_card_id=None, decimal=None, sign="bank"):
+    if not row.get('date'): raise ValueError("missing date")
+    if row.get('amount') in (None, ''): raise ValueError("missing amount")
+    amount = parse_statement_amount(row['amount'], decimal)
+    direction = row.get('direction') or amount_direction(amount, sign)
+    if direction == 'credit' and target != 'incomes': raise ValueError("credit entry")
+    if direction == 'debit' and target == 'incomes': raise ValueError("debit entry")
+
+    description = (row.get('description') or row.get('establishment') or '').strip()
+    if not description: raise ValueError("missing description")
+
+    card_key = (row.get('card_id') or row.get('card') or '').strip()
+    card_id = cards.get(card_key) or cards.get(card_key.lower()) if card_key else default_card_id
+    if card_key and not card_id: raise ValueError(f"unknown card {card_key!r}")
+
+    installments = None
+    match = re.search(r'(\d{1,3})\s*/\s*(\d{1,3})', row.get('installments') or '')
+    if match: installments = f"{int(match.group(1))}/{int(match.group(2))}"
+
+    return {
+        "description": description,
+        "amount": abs(amount),
+        "date": parse_statement_date(row['date']),
+        "category": row.get('category') or 'General',
+        "buyer": row.get('buyer') or None,
+        "establishment": row.get('establishment') or None,
+        "payment_method": row.get('payment_method') or ('credit' if card_id else 'debit'),
+        "card_id": str(card_id) if card_id else None,
+        "installments": installments,
+        "observation": row.get('observation') or None,
+        "fitid": row.get('fitid')
+    }
+
+def content_hash(user_id, target, data, occurrence):
+    key = "|".join(str(v) for v in (
+        user_id, target, data['date'], f"{data['amount']:.2f}", data['description'].lower(),
+        data['installments'], data['card_id'], data['fitid'], occurrence
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def insert_import_batch(target, batch, lines, report):
+    inserted = batch
+    try:
+        db[target].insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        failed = set()
+        for err in e.details.get('writeErrors', []):
+            failed.add(err['index'])
+            if err.get('code') == 11000:
+                report['duplicates'] += 1
+            else:
+                report['rejected'] += 1
+                if len(report['errors']) < IMPORT_MAX_ERRORS:
+                    report['errors'].append({"line": lines[err['index']], "error": err.get('errmsg')})
+        inserted = [doc for i, doc in enumerate(batch) if i not in failed]
+    report['inserted'] += len(inserted)
+    if target in ROLLUP_KINDS: apply_rollup_deltas(ROLLUP_KINDS[target], added=inserted)
+
+def import_statement(user_id, target, records, default_card_id=None, decimal=None, sign="bank"):
+    started = time.perf_counter()
+    cards = {}
+    for card in db.credit_cards.find({"user_id": user_id}, {"name": 1}):
+        cards[str(card['_id'])] = card['_id']
+        cards[card['name'].strip().lower()] = card['_id']
+
+    report = {"target": target, "rows": 0, "inserted": 0, "duplicates": 0, "rejected": 0, "errors": []}
+    occurrences = {}
+    batch, lines = [], []
+    for line_no, row in records:
+        report['rows'] += 1
+        try:
+            data = statement_row_data(target, row, cards, default_card_id, decimal, sign)
+        except ValueError as e:
+            report['rejected'] += 1
+            if len(report['errors']) < IMPORT_MAX_ERRORS: report['errors'].append({"line": line_no, "error": str(e)})
+            continue
+
+        # Identical rows inside one statement are legitimate (two equal purchases on
+        # the same day), so the hash includes the row's occurrence number.
+        base = content_hash(user_id, target, data, 0)
+        occurrences[base] = occurrences.get(base, 0) + 1
+        doc = IMPORT_TARGETS[target](user_id, data)
+        doc['content_hash'] = content_hash(user_id, target, data, occurrences[base])
+        batch.append(doc)
+        lines.append(line_no)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            insert_import_batch(target, batch, lines, report)
+            batch, lines = [], []
+    if batch: insert_import_batch(target, batch, lines, report)
+    if target == 'expenses' and report['inserted']: invalidate_statements(user_id)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_second'] = round(report['rows'] / report['seconds']) if report['seconds'] else report['rows']
+    return report
+
+def statement_records(stream, fmt, mapping=None):
+    return ofx_records(stream) if fmt == 'ofx' else csv_records(stream, mapping)
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_statement_route():
+    upload = request.files.get('file')
+    target = request.form.get('target', 'expenses')
+    if not upload or target not in IMPORT_TARGETS:
+        return jsonify({"error": "File and a valid target are required"}), 400
+
+    fmt = request.form.get('format') or ('ofx' if upload.filename.lower().endswith('.ofx') else 'csv')
+    decimal = request.form.get('decimal') or None
+    sign = request.form.get('sign', 'bank')
+    if decimal not in (None, *DECIMAL_SEPARATORS) or sign not in AMOUNT_SIGNS:
+        return jsonify({"error": "decimal must be ',' or '.' and sign 'bank' or 'card'"}), 400
+    try:
+        mapping = parse_mapping(request.form['mapping']) if request.form.get('mapping') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_id = ObjectId(current_user.id)
+    card_id = None
+    if request.form.get('card_id'):
+        card = db.credit_cards.find_one({"_id": ObjectId(request.form['card_id']), "user_id": user_id}, {"_id": 1})
+        if not card: return jsonify({"error": "Card not found"}), 404
+        card_id = card['_id']
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        records = statement_records(stream, fmt, mapping)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(import_statement(user_id, target, records, card_id, decimal, sign))
+
 @app.route('/api/investments', methods=['GET', 'POST'])
 @app.route('/api/investments/<inv_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def investments(inv_id=None):
     if request.method == 'DELETE':
-        db.investments.delete_one({"_id": ObjectId(inv_id), "user_id": ObjectId(current_user.id)})
-        db.investment_entries.delete_many({"investment_id": ObjectId(inv_id)})
+        res = db.investments.delete_one({"_id": ObjectId(inv_id), "user_id": ObjectId(current_user.id)})
+        if res.deleted_count:
+            removed = list(db.investment_entries.find({"investment_id": ObjectId(inv_id)}, {"user_id": 1, "date": 1, "type": 1, "amount": 1}))
+            db.investment_entries.delete_many({"investment_id": ObjectId(inv_id)})
+            apply_rollup_deltas('investment', removed=removed)
         return jsonify({"status": "deleted"})
         
     if request.method == 'PUT':
@@ -732,17 +3052,49 @@ def investments(inv_id=None):
         new_inv['_id'] = res.inserted_id
         return jsonify(serialize_doc(new_inv))
 
-    invs = list(db.investments.find({"user_id": ObjectId(current_user.id)}))
+    invs = list(db.investments.find({"user_id": ObjectId(current_user.id)}, list_projection(request.args)))
     return jsonify([serialize_doc(i) for i in invs])
 
 @app.route('/api/investments/history', methods=['GET'])
 @login_required
+@cached_view
 def investments_history():
-    entries = list(db.investment_entries.find({"user_id": ObjectId(current_user.id)}).sort("date", 1))
+    entries = list(db.investment_entries.find({"user_id": ObjectId(current_user.id)}, list_projection(request.args)).sort("date", 1))
     return jsonify([serialize_doc(e) for e in entries])
 
+@app.route('/api/investments/series', methods=['GET'])
+@login_required
+@cached_view
+def investments_series():
+    resolution = request.args.get('resolution', 'month')
+    if resolution not in SERIES_FORMATS: return jsonify({"error": "Invalid resolution"}), 400
+    user_id = ObjectId(current_user.id)
+    inv_query = {"user_id": user_id}
+    if request.args.get('investment_id'): inv_query["_id"] = ObjectId(request.args['investment_id'])
+    invs = {i['_id']: i for i in db.investments.find(inv_query, {"name": 1, "current_amount": 1})}
+    if not invs: return jsonify({"resolution": resolution, "series": []})
+
+    points = analytics.investment_points(user_id, list(invs), resolution)
+
+    # Balances set when an investment was created are not entries, so each series
+    # starts from current_amount minus everything its entries added.
+    series = {inv_id: [] for inv_id in invs}
+    for p in points:
+        inv = invs[p['investment_id']]
+        series[inv['_id']].append({
+            "period": p['period'],
+            "contributions": p['contributions'],
+            "withdrawals": p['withdrawals'],
+            "balance": inv.get('current_amount', 0) - p['total_net'] + p['running']
+        })
+    return jsonify({
+        "resolution": resolution,
+        "series": [{"investment_id": str(inv_id), "name": invs[inv_id]['name'], "points": pts} for inv_id, pts in series.items()]
+    })
+
 @app.route('/api/investments/<inv_id>/entries', methods=['GET', 'POST'])
 @login_required
+@cached_view
 def investment_entries(inv_id):
     if request.method == 'POST':
         data = request.json
@@ -754,21 +3106,37 @@ def investment_entries(inv_id):
             "type": entry_type,
             "amount": amount,
             "date": data['date'],
+            "date_dt": to_date(data['date']),
             "created_at": datetime.utcnow()
         }
-        db.investment_entries.insert_one(new_entry)
-        inv = db.investments.find_one({"_id": ObjectId(inv_id)})
-        current_val = float(inv.get('current_amount', 0))
-        if entry_type == 'withdrawal': new_val = current_val - amount
-        else: new_val = current_val + amount
-        db.investments.update_one({"_id": ObjectId(inv_id)}, {"$set": {"current_amount": new_val, "updated_at": datetime.utcnow()}})
-        return jsonify({"status": "success", "new_balance": new_val})
-    entries = list(db.investment_entries.find({"investment_id": ObjectId(inv_id)}).sort("date", -1))
+
+        # Time-series collections reject writes inside transactions, so the balance is
+        # moved first and moved back if the entry cannot be stored.
+        delta = -amount if entry_type == 'withdrawal' else amount
+        inv_filter = {"_id": ObjectId(inv_id), "user_id": ObjectId(current_user.id)}
+        inv = db.investments.find_one_and_update(
+            inv_filter,
+            {"$inc": {"current_amount": delta}, "$set": {"updated_at": datetime.utcnow()}},
+            projection={"current_amount": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not inv: return jsonify({"error": "Investment not found"}), 404
+        try:
+            db.investment_entries.insert_one(dict(new_entry))
+        except Exception:
+            db.investments.update_one(inv_filter, {"$inc": {"current_amount": -delta}, "$set": {"updated_at": datetime.utcnow()}})
+            raise
+        apply_rollup_deltas('investment', added=[new_entry])
+        return jsonify({"status": "success", "new_balance": inv['current_amount']})
+    entries = list(db.investment_entries.find(
+        {"user_id": ObjectId(current_user.id), "investment_id": ObjectId(inv_id)}, list_projection(request.args)
+    ).sort("date", -1))
     return jsonify([serialize_doc(e) for e in entries])
 
 @app.route('/api/goals', methods=['GET', 'POST'])
 @app.route('/api/goals/<goal_id>', methods=['PUT', 'DELETE'])
 @login_required
+@cached_view
 def goals(goal_id=None):
     if request.method == 'DELETE':
         db.goals.delete_one({"_id": ObjectId(goal_id), "user_id": ObjectId(current_user.id)})
@@ -789,21 +3157,12 @@ def goals(goal_id=None):
         return jsonify({"status": "updated"})
 
     if request.method == 'POST':
-        data = request.json
-        new_goal = {
-            "user_id": ObjectId(current_user.id),
-            "title": data['title'],
-            "type": data.get('type', 'spending'),
-            "target_amount": float(data['target_amount']),
-            "current_amount": float(data.get('current_amount', 0)),
-            "deadline": data['deadline'],
-            "created_at": datetime.utcnow()
-        }
+        new_goal = goal_doc(ObjectId(current_user.id), request.json)
         res = db.goals.insert_one(new_goal)
         new_goal['_id'] = res.inserted_id
         return jsonify(serialize_doc(new_goal))
 
-    goals = list(db.goals.find({"user_id": ObjectId(current_user.id)}))
+    goals = list(db.goals.find({"user_id": ObjectId(current_user.id)}, list_projection(request.args)))
     return jsonify([serialize_doc(g) for g in goals])
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+"""Synthetic data and endpoint benchmarks.
+
+    python bench.py seed --users 1 --expenses 100000
+    python bench.py run --username bench_0 --save benchmarks/baseline.json
+    python bench.py run --username bench_0 --compare benchmarks/baseline.json
+    python bench.py coldstart --save benchmarks/coldstart.json
+
+Both commands use MONGO_URI, like the app, and refuse to write to a
+non-local server unless --allow-remote is given.
+"""
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import click
+import numpy as np
+from bson.objectid import ObjectId
+from dateutil.relativedelta import relativedelta
+from werkzeug.security import generate_password_hash
+
+import app as finscope
+from app import db
+
+BATCH_SIZE = 5000
+PASSWORD = "bench"
+CATEGORIES = ["Food", "Housing", "Transport", "Health", "Leisure", "Education", "Shopping", "Services"]
+BUYERS = ["Me", "Partner", "Kids"]
+ESTABLISHMENTS = ["Mercado Extra", "Padaria São João", "Posto Shell", "Farmácia Drogasil", "iFood", "Uber", "Amazon", "Netflix", "Açougue Boi Gordo", "Restaurante Sabor"]
+CLOSING_DAYS = [1, 5, 10, 15, 20, 25, 28, 30, 31]
+USER_COLLECTIONS = ("user_settings", "wallets", "goals", "credit_cards", "investments", "investment_entries",
+                    "incomes", "expenses", "macro_expenses", "installment_plans", "monthly_rollups", "card_statements")
+
+def check_target(allow_remote):
+    host = urlparse(os.getenv("MONGO_URI", "mongodb://localhost:27017/finscope")).hostname
+    if host not in ("localhost", "127.0.0.1", "::1") and not allow_remote:
+        raise click.ClickException(f"MONGO_URI points at {host}; pass --allow-remote to use it anyway.")
+
+def insert_batched(coll_name, docs):
+    batch, count = [], 0
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == BATCH_SIZE:
+            db[coll_name].insert_many(batch, ordered=False)
+            count, batch = count + len(batch), []
+    if batch:
+        db[coll_name].insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
+
+def random_day(rng, start, days):
+    return (start + timedelta(days=rng.randrange(days))).strftime('%Y-%m-%d')
+
+def seed_user(rng, username, expenses, years):
+    user_id = db.users.insert_one({"username": username, "password_hash": generate_password_hash(PASSWORD), "created_at": datetime.utcnow()}).inserted_id
+    start = datetime.now() - relativedelta(years=years)
+    days = (datetime.now() - start).days
+    db.user_settings.insert_one({"user_id": user_id, "categories": CATEGORIES, "buyers": BUYERS})
+
+    cards = []
+    for name in ("Nubank", "Inter", "Itaú")[:rng.randint(1, 3)]:
+        closing_day = rng.choice(CLOSING_DAYS)
+        cards.append(db.credit_cards.insert_one({
+            "user_id": user_id, "name": name, "holder_name": username, "limit_amount": float(rng.choice([2000, 5000, 12000])),
+            "closing_day": closing_day, "due_day": (closing_day + 7) % 28 or 28, "created_at": datetime.utcnow()
+        }).inserted_id)
+
+    def expense_data():
+        card_id = rng.choice(cards) if rng.random() < 0.6 else None
+        return {
+            "description": rng.choice(ESTABLISHMENTS), "amount": round(rng.lognormvariate(3.5, 1), 2), "date": random_day(rng, start, days),
+            "category": rng.choice(CATEGORIES), "establishment": rng.choice(ESTABLISHMENTS), "buyer": rng.choice(BUYERS),
+            "payment_method": "credit" if card_id else rng.choice(["debit", "pix", "cash"]), "card_id": str(card_id) if card_id else None,
+            "observation": ""
+        }
+
+    # Roughly one row in ten belongs to an installment plan, as in real card statements.
+    plans, plan_rows = {}, 0
+    while plan_rows < expenses // 10:
+        total = rng.randint(2, 12)
+        data = {**expense_data(), "card_id": str(rng.choice(cards)), "payment_method": "credit"}
+        plan = finscope.installment_plan_doc(user_id, data, rng.randint(1, total), total)
+        plans[plan['_id']] = plan
+        plan_rows += total
+    counts = {
+        "installment_plans": insert_batched("installment_plans", plans.values()),
+        "expenses": insert_batched("expenses", (finscope.expense_doc(user_id, expense_data()) for _ in range(expenses - plan_rows))),
+        "macro_expenses": insert_batched("macro_expenses", (finscope.macro_expense_doc(user_id, {
+            "description": f"Fatura {rng.choice(['Nubank', 'Inter'])}", "amount": round(rng.uniform(200, 4000), 2),
+            "date": random_day(rng, start, days), "category": rng.choice(CATEGORIES), "payment_method": rng.choice(["debit", "pix"])
+        }) for _ in range(max(expenses // 10, 1)))),
+        "incomes": insert_batched("incomes", (finscope.income_doc(user_id, {
+            "description": rng.choice(["Salário", "Freela", "Dividendos"]), "amount": round(rng.uniform(500, 9000), 2),
+            "date": random_day(rng, start, days)
+        }) for _ in range(max(expenses // 20, years * 12))))
+    }
+
+    entries = []
+    for name, kind in (("Tesouro Selic", "fixed"), ("CDB", "fixed"), ("Ações", "stock"))[:rng.randint(1, 3)]:
+        inv_id = ObjectId()
+        balance = 0.0
+        for month in range(years * 12):
+            entry_type = "withdrawal" if balance > 1000 and rng.random() < 0.15 else "contribution"
+            amount = round(rng.uniform(100, 1500), 2)
+            balance += -amount if entry_type == "withdrawal" else amount
+            date = (start + relativedelta(months=month, days=rng.randrange(28))).strftime('%Y-%m-%d')
+            entries.append({"user_id": user_id, "investment_id": inv_id, "type": entry_type, "amount": amount,
+                            "date": date, "date_dt": finscope.to_date(date), "created_at": datetime.utcnow()})
+        db.investments.insert_one({"_id": inv_id, "user_id": user_id, "name": name, "type": kind, "current_amount": round(balance, 2),
+                                   "target_amount": 50000.0, "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()})
+    counts["investment_entries"] = insert_batched("investment_entries", entries)
+
+    db.wallets.insert_many([{"user_id": user_id, "name": name, "balance": round(rng.uniform(100, 20000), 2),
+                             "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()} for name in ("Conta corrente", "Poupança")])
+    db.goals.insert_many([{"user_id": user_id, "title": title, "type": kind, "target_amount": target, "current_amount": round(target * rng.random(), 2),
+                           "deadline": (datetime.now() + relativedelta(months=rng.randint(3, 24))).strftime('%Y-%m-%d'), "created_at": datetime.utcnow()}
+                          for title, kind, target in (("Viagem", "saving", 15000.0), ("Mercado", "spending", 1500.0))])
+    finscope.rebuild_rollups(user_id)
+    return counts
+
+def bench_routes(user_id):
+    card = db.credit_cards.find_one({"user_id": user_id})
+    inv = db.investments.find_one({"user_id": user_id})
+    month = datetime.now().strftime('%Y-%m')
+    year_ago = (datetime.now() - relativedelta(months=11)).strftime('%Y-%m')
+    routes = [
+        ("settings", "/api/settings"),
+        ("years", "/api/years"),
+        ("balance", "/api/balance"),
+        ("transactions page", "/api/transactions?page=1"),
+        ("transactions cursor", "/api/transactions?after=&limit=30"),
+        ("transactions micro", "/api/transactions?scope=micro&after=&limit=30"),
+        ("dashboard", "/api/dashboard"),
+        ("dashboard 30 days", "/api/dashboard?period=30&granularity=day"),
+        ("dashboard all days", "/api/dashboard?granularity=day"),
+        ("dashboard categories", "/api/dashboard?view_mode=category"),
+        ("wallets", "/api/wallets"),
+        ("cards", "/api/cards"),
+        ("all card invoices", f"/api/cards/invoices?from={year_ago}&to={month}"),
+        ("incomes", "/api/incomes"),
+        ("macro expenses", "/api/macro-expenses"),
+        ("expenses", "/api/expenses"),
+        ("expense search", "/api/expenses?search=mercado"),
+        ("investments", "/api/investments"),
+        ("investment history", "/api/investments/history"),
+        ("investment series", "/api/investments/series?resolution=week"),
+        ("goals", "/api/goals"),
+        ("bootstrap", "/api/bootstrap?limit=30&max_points=400"),
+        ("forecast 5 years", "/api/forecast?months=60"),
+        ("export expenses", "/api/export/expenses?format=ndjson")
+    ]
+    if card:
+        routes += [
+            ("card invoice", f"/api/cards/{card['_id']}/invoice?month={month}"),
+            ("card invoices", f"/api/cards/{card['_id']}/invoices?from={year_ago}&to={month}")
+        ]
+    if inv: routes.append(("investment entries", f"/api/investments/{inv['_id']}/entries"))
+    return routes
+
+def write_routes():
+    today = datetime.now().strftime('%Y-%m-%d')
+    return [
+        ("POST expense", "/api/expenses", {"description": "Bench", "amount": 10, "date": today, "category": "Food"}),
+        ("POST installments", "/api/expenses", {"description": "Bench plan", "amount": 10, "date": today, "installments": "1/10"}),
+        ("POST income", "/api/incomes", {"description": "Bench", "amount": 10, "date": today}),
+        ("POST macro expense", "/api/macro-expenses", {"description": "Bench", "amount": 10, "date": today, "category": "Food"})
+    ]
+
+def measure(fn, repeat):
+    samples, queries, sizes = [], [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = fn()
+        size = len(response.get_data())
+        samples.append(time.perf_counter() - started)
+        timing = re.search(r'desc="(\d+) queries', response.headers.get('Server-Timing', ''))
+        queries.append(int(timing.group(1)) if timing else 0)
+        sizes.append(size)
+        if response.status_code >= 400: raise click.ClickException(f"{response.request.path} answered {response.status_code}")
+    return {**percentiles(samples), "queries": max(queries), "bytes": max(sizes)}
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def save_report(report, save):
+    os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+    with open(save, 'w') as f: json.dump(report, f, indent=2)
+    click.echo(f"Baseline written to {save}")
+
+def compare_report(results, compare, tolerance):
+    with open(compare) as f: baseline = json.load(f)
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['routes'].get(name)
+        if not previous: continue
+        change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0
+        flag = "  REGRESSION" if change > tolerance else ""
+        click.echo(f"{name:<24} p95 {previous['p95_ms']:>8.2f} -> {current['p95_ms']:>8.2f}ms ({change:+.0%}){flag}")
+        if flag: regressions.append(name)
+    if regressions: raise SystemExit(1)
+
+# Runs in a fresh interpreter per sample: app import, login, then one API request.
+COLDSTART_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.post('/login', data={"username": sys.argv[1], "password": sys.argv[2]})
+logged_in = time.perf_counter()
+status = client.get(sys.argv[3]).status_code
+print(json.dumps({"import": imported - started, "login": logged_in - imported, "first request": time.perf_counter() - logged_in, "status": status}))
+"""
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--users', default=1, show_default=True)
+@click.option('--expenses', default=10000, show_default=True, help="Expense rows per user, installments included.")
+@click.option('--years', default=3, show_default=True)
+@click.option('--prefix', default="bench_", show_default=True)
+@click.option('--seed', 'random_seed', default=42, show_default=True)
+@click.option('--reset', is_flag=True, help="Delete existing users with the same names first.")
+@click.option('--allow-remote', is_flag=True)
+def seed(users, expenses, years, prefix, random_seed, reset, allow_remote):
+    check_target(allow_remote)
+    finscope.ensure_indexes()
+    rng = random.Random(random_seed)
+    for i in range(users):
+        username = f"{prefix}{i}"
+        existing = db.users.find_one({"username": username})
+        if existing and not reset:
+            click.echo(f"{username} exists, skipped (use --reset)")
+            continue
+        if existing:
+            for coll_name in USER_COLLECTIONS: db[coll_name].delete_many({"user_id": existing['_id']})
+            db.users.delete_one({"_id": existing['_id']})
+        started = time.perf_counter()
+        counts = seed_user(rng, username, expenses, years)
+        click.echo(f"{username}: {', '.join(f'{n} {c}' for n, c in counts.items())} in {time.perf_counter() - started:.1f}s")
+
+@cli.command()
+@click.option('--username', default="bench_0", show_default=True)
+@click.option('--repeat', default=20, show_default=True)
+@click.option('--warm', is_flag=True, help="Keep the response cache between requests.")
+@click.option('--writes', is_flag=True, help="Also time POST routes; the rows they create are deleted afterwards.")
+@click.option('--save', type=click.Path(dir_okay=False), help="Write the results as a JSON baseline.")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help="Baseline to compare p95 against.")
+@click.option('--tolerance', default=0.2, show_default=True, help="Allowed p95 regression before exiting with 1.")
+@click.option('--allow-remote', is_flag=True)
+def run(username, repeat, warm, writes, save, compare, tolerance, allow_remote):
+    check_target(allow_remote)
+    user = db.users.find_one({"username": username})
+    if not user: raise click.ClickException(f"User {username} not found; run `python bench.py seed` first")
+
+    client = finscope.app.test_client()
+    client.post('/login', data={"username": username, "password": PASSWORD})
+    results = {}
+    for name, path in bench_routes(user['_id']):
+        def request_route():
+            if not warm: finscope.response_cache.clear()
+            return client.get(path)
+        results[name] = measure(request_route, repeat)
+        click.echo(f"{name:<24} p50 {results[name]['p50_ms']:>8.2f}ms  p95 {results[name]['p95_ms']:>8.2f}ms  "
+                   f"p99 {results[name]['p99_ms']:>8.2f}ms  {results[name]['queries']:>3} queries  {results[name]['bytes']:>9} bytes")
+
+    if writes:
+        before = datetime.utcnow()
+        for name, path, body in write_routes():
+            results[name] = measure(lambda: client.post(path, json=body), repeat)
+            click.echo(f"{name:<24} p50 {results[name]['p50_ms']:>8.2f}ms  p95 {results[name]['p95_ms']:>8.2f}ms  "
+                       f"p99 {results[name]['p99_ms']:>8.2f}ms  {results[name]['queries']:>3} queries")
+        for coll_name in ("expenses", "incomes", "macro_expenses", "installment_plans"):
+            db[coll_name].delete_many({"user_id": user['_id'], "description": {"$regex": "^Bench"}, "created_at": {"$gte": before}})
+        finscope.rebuild_rollups(user['_id'])
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "username": username,
+        "expenses": db.expenses.count_documents({"user_id": user['_id']}),
+        "repeat": repeat,
+        "routes": results
+    }
+    if save: save_report(report, save)
+    if compare: compare_report(results, compare, tolerance)
+
+@cli.command()
+@click.option('--username', default="bench_0", show_default=True)
+@click.option('--path', default="/api/dashboard", show_default=True, help="Route timed as the first request.")
+@click.option('--repeat', default=10, show_default=True, help="Fresh interpreters to start.")
+@click.option('--serverless/--no-serverless', default=True, show_default=True, help="Set SERVERLESS for the child processes.")
+@click.option('--save', type=click.Path(dir_okay=False), help="Write the results as a JSON baseline.")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help="Baseline to compare p95 against.")
+@click.option('--tolerance', default=0.2, show_default=True, help="Allowed p95 regression before exiting with 1.")
+@click.option('--allow-remote', is_flag=True)
+def coldstart(username, path, repeat, serverless, save, compare, tolerance, allow_remote):
+    check_target(allow_remote)
+    if not db.users.find_one({"username": username}): raise click.ClickException(f"User {username} not found; run `python bench.py seed` first")
+
+    env = {**os.environ, "SERVERLESS": "1" if serverless else "0"}
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    samples = {"process": [], "import": [], "login": [], "first request": []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        child = subprocess.run([sys.executable, "-c", COLDSTART_SCRIPT, username, PASSWORD, path], capture_output=True, text=True, env=env, cwd=cwd)
+        elapsed = time.perf_counter() - started
+        if child.returncode: raise click.ClickException(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else "child process failed")
+        timings = json.loads(child.stdout.strip().splitlines()[-1])
+        if timings.pop('status') >= 400: raise click.ClickException(f"{path} answered an error")
+        samples["process"].append(elapsed)
+        for name, seconds in timings.items(): samples[name].append(seconds)
+
+    results = {}
+    for name, values in samples.items():
+        key = f"coldstart {name}"
+        results[key] = percentiles(values)
+        click.echo(f"{key:<24} p50 {results[key]['p50_ms']:>8.2f}ms  p95 {results[key]['p95_ms']:>8.2f}ms")
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "username": username,
+        "serverless": serverless,
+        "repeat": repeat,
+        "routes": results
+    }
+    if save: save_report(report, save)
+    if compare: compare_report(results, compare, tolerance)
+
+if __name__ == "__main__":
+    cli()
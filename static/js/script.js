@@ -74,7 +74,10 @@ document.addEventListener('DOMContentLoaded', () => {
     
     let currentPage = 1;
     const itemsPerPage = 30;
+    const MAX_CHART_POINTS = 400;
     let allTableData = []; 
+    let transactionCursors = [''];
+    let transactionsTotal = 0;
     
     let chartGranularity = 'month'; 
     let chartDays = 30;
@@ -92,11 +95,10 @@ document.addEventListener('DOMContentLoaded', () => {
     let financeChart = null;
     let detailedChart = null;
 
-    loadSettings(); 
-
     if(document.getElementById('financeChart')) {
-        loadYears();
-        loadCards(); 
+        loadBootstrap();
+    } else {
+        loadSettings();
     }
     
     if(document.getElementById('cards-container')) {
@@ -344,13 +346,49 @@ document.addEventListener('DOMContentLoaded', () => {
         loadData(false);
     }
 
+    async function loadBootstrap() {
+        // The dashboard's first paint comes from one payload, inlined in the page when the server enables it.
+        try {
+            const inline = document.getElementById('bootstrap-data');
+            let data;
+            if(inline) {
+                data = JSON.parse(inline.textContent);
+            } else {
+                const params = new URLSearchParams({
+                    period: currentFilter,
+                    year: selectedYear,
+                    granularity: chartGranularity,
+                    view_mode: viewModeSelect ? viewModeSelect.value : 'general',
+                    max_points: MAX_CHART_POINTS,
+                    limit: itemsPerPage
+                });
+                const res = await fetch(`/api/bootstrap?${params.toString()}`);
+                data = await res.json();
+            }
+            applySettings(data.settings);
+            renderYears(data.years);
+            renderCardOptions(data.cards);
+            updateDashboard(data.dashboard.summary);
+            updateChart(data.dashboard.chart_data);
+            applyTransactionsPage(data.transactions, 1);
+        } catch (err) {
+            console.error(err);
+            loadSettings();
+            loadYears();
+            loadCards();
+        }
+    }
+
+    function applySettings(data) {
+        currentCategories = data.categories || [];
+        currentBuyers = data.buyers || [];
+        updateSelects();
+    }
+
     async function loadSettings() {
         try {
             const res = await fetch('/api/settings');
-            const data = await res.json();
-            currentCategories = data.categories || [];
-            currentBuyers = data.buyers || [];
-            updateSelects();
+            applySettings(await res.json());
         } catch (err) { console.error(err); }
     }
 
@@ -584,43 +622,48 @@ document.addEventListener('DOMContentLoaded', () => {
     async function loadYears() {
         try {
             const res = await fetch('/api/years');
-            const years = await res.json();
-            yearSelect.innerHTML = '';
-            years.forEach(year => {
-                const opt = document.createElement('option');
-                opt.value = year;
-                opt.textContent = year;
-                if(year === selectedYear) opt.selected = true;
-                yearSelect.appendChild(opt);
-            });
+            renderYears(await res.json());
             loadData(); 
         } catch(err) { console.error(err); }
     }
 
+    function renderYears(years) {
+        yearSelect.innerHTML = '';
+        years.forEach(year => {
+            const opt = document.createElement('option');
+            opt.value = year;
+            opt.textContent = year;
+            if(year === selectedYear) opt.selected = true;
+            yearSelect.appendChild(opt);
+        });
+    }
+
     async function loadCards() {
         try {
             const res = await fetch('/api/cards');
-            const cards = await res.json();
-            
-            const selects = [cardSelect, consCardSelect];
-            selects.forEach(sel => {
-                if(sel) {
-                    const currentVal = sel.value;
-                    const defaultOpt = sel.id === 'cons-card' ? '<option value="">Nenhum</option>' : '<option value="">Selecione...</option>';
-                    sel.innerHTML = defaultOpt;
-                    
-                    cards.forEach(card => {
-                        const option = document.createElement('option');
-                        option.value = card._id;
-                        option.textContent = card.name;
-                        sel.appendChild(option);
-                    });
-                    if(currentVal) sel.value = currentVal;
-                }
-            });
+            renderCardOptions(await res.json());
         } catch (err) { console.error(err); }
     }
 
+    function renderCardOptions(cards) {
+        const selects = [cardSelect, consCardSelect];
+        selects.forEach(sel => {
+            if(sel) {
+                const currentVal = sel.value;
+                const defaultOpt = sel.id === 'cons-card' ? '<option value="">Nenhum</option>' : '<option value="">Selecione...</option>';
+                sel.innerHTML = defaultOpt;
+                
+                cards.forEach(card => {
+                    const option = document.createElement('option');
+                    option.value = card._id;
+                    option.textContent = card.name;
+                    sel.appendChild(option);
+                });
+                if(currentVal) sel.value = currentVal;
+            }
+        });
+    }
+
     async function handleFormSubmit(e, type) {
         e.preventDefault();
         
@@ -922,7 +965,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 period: currentFilter,
                 year: selectedYear,
                 granularity: chartGranularity,
-                view_mode: viewModeSelect ? viewModeSelect.value : 'general'
+                view_mode: viewModeSelect ? viewModeSelect.value : 'general',
+                max_points: MAX_CHART_POINTS
             });
 
             const res = await fetch(`/api/dashboard?${params.toString()}`);
@@ -939,24 +983,31 @@ document.addEventListener('DOMContentLoaded', () => {
 
     async function loadTransactionsPage(page) {
         try {
-            const res = await fetch(`/api/transactions?page=${page}`);
-            const pageData = await res.json();
-            
-            allTableData = pageData.items; 
-            currentPage = pageData.current_page;
-            
-            renderPagination(pageData);
-            renderTablePage();
+            const params = new URLSearchParams({ limit: itemsPerPage, after: transactionCursors[page - 1] });
+            if(page === 1) params.set('count', '1');
+
+            const res = await fetch(`/api/transactions?${params.toString()}`);
+            applyTransactionsPage(await res.json(), page);
         } catch (error) {
             console.error('Error loading transactions:', error);
         }
     }
 
+    function applyTransactionsPage(pageData, page) {
+        allTableData = pageData.items; 
+        currentPage = page;
+        if(page === 1) transactionsTotal = pageData.total_items;
+        transactionCursors[page] = pageData.next_cursor;
+        
+        renderPagination({ total_items: transactionsTotal, current_page: page, has_next: !!pageData.next_cursor });
+        renderTablePage();
+    }
+
     async function loadDetailedData(isSearch = false) {
         try {
             let url = '/api/expenses?view_type=detailed';
             if(isSearch && searchTerm.value) {
-                url += `&search=${searchTerm.value}`;
+                url += `&search=${encodeURIComponent(searchTerm.value)}`;
             }
             
             const res = await fetch(url);
@@ -1016,7 +1067,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if(!paginationControls) return;
         paginationControls.innerHTML = '';
         
-        const { total_items, current_page, total_pages } = pageData || { total_items: 0, current_page: 1, total_pages: 1 };
+        const { total_items, current_page, has_next } = pageData || { total_items: 0, current_page: 1, has_next: false };
         
         const summary = document.createElement('div');
         summary.style.width = '100%';
@@ -1025,22 +1076,31 @@ document.addEventListener('DOMContentLoaded', () => {
         summary.style.fontSize = '0.9rem';
         summary.style.color = 'var(--text-secondary)';
         
-        const start = (current_page - 1) * itemsPerPage + 1;
-        const end = Math.min(current_page * itemsPerPage, total_items);
+        const start = allTableData.length ? (current_page - 1) * itemsPerPage + 1 : 0;
+        const end = (current_page - 1) * itemsPerPage + allTableData.length;
         summary.textContent = `Mostrando ${start}-${end} de ${total_items} registros`;
         paginationControls.appendChild(summary);
 
-        if(total_pages <= 1) return;
-
-        for(let i = 1; i <= total_pages; i++) {
-            const btn = document.createElement('button');
-            btn.className = `page-btn ${i === current_page ? 'active' : ''}`;
-            btn.textContent = i;
-            btn.onclick = () => {
-                loadTransactionsPage(i);
-            };
-            paginationControls.appendChild(btn);
-        }
+        if(current_page === 1 && !has_next) return;
+
+        const prevBtn = document.createElement('button');
+        prevBtn.className = 'page-btn';
+        prevBtn.textContent = '‹';
+        prevBtn.disabled = current_page === 1;
+        prevBtn.onclick = () => loadTransactionsPage(current_page - 1);
+        paginationControls.appendChild(prevBtn);
+
+        const pageBtn = document.createElement('button');
+        pageBtn.className = 'page-btn active';
+        pageBtn.textContent = current_page;
+        paginationControls.appendChild(pageBtn);
+
+        const nextBtn = document.createElement('button');
+        nextBtn.className = 'page-btn';
+        nextBtn.textContent = '›';
+        nextBtn.disabled = !has_next;
+        nextBtn.onclick = () => loadTransactionsPage(current_page + 1);
+        paginationControls.appendChild(nextBtn);
     }
 
     function renderTablePage() {
@@ -34,7 +34,7 @@ async function openSidebar(date, scope) {
     body.innerHTML = '<div class="sb-spinner"></div>';
 
     try {
-        const res = await fetch(`/api/transactions?date=${date}&scope=${scope}&limit=100`);
+        const res = await fetch(`/api/transactions?date=${date}&scope=${scope}&limit=100&after=`);
         const data = await res.json();
 
         if (!data.items || data.items.length === 0) {
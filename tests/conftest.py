@@ -0,0 +1,6 @@
+import os
+
+# app reads MONGO_URI at import, and the unit tests import it at collection time:
+# point it at the scratch database before anything can reach the real one.
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017/finscope_test")
+os.environ["MONGO_URI"] = MONGO_TEST_URI
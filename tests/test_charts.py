@@ -0,0 +1,58 @@
+"""Chart pivoting and LTTB downsampling; no database needed."""
+import numpy as np
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+
+
+def test_pivot_sums_duplicates_and_sorts_keys():
+    dates, series, matrix = app.pivot_series(["2025-01-02", "2025-01-01", "2025-01-02"], ["b", "a", "b"], [1, 2, 3])
+    assert dates == ["2025-01-01", "2025-01-02"]
+    assert series == ["a", "b"]
+    assert matrix.tolist() == [[2, 0], [0, 4]]
+
+
+def test_pivot_keeps_given_series_order():
+    _, series, matrix = app.pivot_series(["2025-01"], ["expense"], [5], series=["income", "expense"])
+    assert series == ["income", "expense"]
+    assert matrix.tolist() == [[0], [5]]
+
+
+def test_empty_pivot():
+    assert app.pivot_series([], [], [])[2].shape == (0, 0)
+    dates, series, matrix = app.pivot_series([], [], [], series=["income"])
+    assert (dates, series, matrix.shape) == ([], ["income"], (1, 0))
+
+
+@pytest.mark.parametrize("n, max_points", [(0, 3), (3, 3), (5, 1000)])
+def test_lttb_keeps_everything_within_budget(n, max_points):
+    assert app.lttb_indices(np.zeros((2, n)), max_points).tolist() == list(range(n))
+
+
+def test_lttb_downsamples_to_budget():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(3, 500))
+    keep = app.lttb_indices(matrix, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 499
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_spikes():
+    matrix = np.zeros((1, 10))
+    matrix[0, 5] = 9
+    assert 5 in app.lttb_indices(matrix, 4)
+
+
+@pytest.mark.parametrize("args, expected", [
+    ({}, app.MAX_CHART_POINTS),
+    ({"max_points": "abc"}, app.MAX_CHART_POINTS),
+    ({"max_points": "10"}, 10),
+    ({"max_points": "2"}, 3),
+    ({"max_points": "0"}, 3),
+    ({"max_points": "-5"}, 3),
+    ({"max_points": str(app.MAX_CHART_POINTS * 10)}, app.MAX_CHART_POINTS),
+])
+def test_chart_points_is_clamped(args, expected):
+    assert app.chart_points(MultiDict(args)) == expected
@@ -0,0 +1,52 @@
+"""Keyset cursors for /api/transactions; no database needed."""
+import pytest
+from bson import ObjectId
+
+import app
+
+OID = str(ObjectId())
+PLAN_ID = "3f786850e387550fdab836ed7e6dc881de23001b"
+
+
+@pytest.mark.parametrize("after, expected", [
+    (f"2025-01-31,{OID}", ("2025-01-31", OID)),
+    (f"2025-01-31,{PLAN_ID}:3", ("2025-01-31", f"{PLAN_ID}:3")),
+    # Rows stored with a time keep it in the cursor; only the date part is validated.
+    (f"2025-01-31T10:00:00,{OID}", ("2025-01-31T10:00:00", OID)),
+])
+def test_parse_cursor(after, expected):
+    assert app.parse_cursor(after) == expected
+
+
+@pytest.mark.parametrize("after", [
+    "",
+    ",",
+    "2025-01-31",
+    "2025-01-31,",
+    f",{OID}",
+    f"2025-13-01,{OID}",
+    f"2025-02-30,{OID}",
+    f"31/01/2025,{OID}",
+    f"abc,{OID}",
+    "2025-01-31,zz",
+    f"2025-01-31,{OID[:-1]}",
+    f"2025-01-31,{PLAN_ID}:x",
+    f"2025-01-31,{PLAN_ID}:",
+    "2025-01-31,:3",
+    f"2025-01-31,{OID},{OID}",
+])
+def test_malformed_cursor(after):
+    with pytest.raises(app.InvalidCursor):
+        app.parse_cursor(after)
+
+
+@pytest.mark.parametrize("expense_id, expected", [
+    (f"{PLAN_ID}:0", (PLAN_ID, 0)),
+    (f"{PLAN_ID}:12", (PLAN_ID, 12)),
+    (OID, (None, None)),
+    (f"{PLAN_ID}:-1", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_split_virtual_id(expense_id, expected):
+    assert app.split_virtual_id(expense_id) == expected
@@ -0,0 +1,101 @@
+"""Forecast projection helpers; no database needed."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import app
+
+
+def day_grid(start, end):
+    return np.arange(np.datetime64(start), np.datetime64(end) + 1)
+
+
+def test_month_days_clamps_short_months():
+    months = np.array(["2025-02", "2024-02", "2025-03"], dtype="datetime64[M]")
+    assert app.month_days(months, 31).astype(str).tolist() == ["2025-02-28", "2024-02-29", "2025-03-31"]
+
+
+@pytest.mark.parametrize("skip_first, booked", [(True, 100.0), (False, 150.0)])
+def test_add_monthly_books_one_event_per_month(skip_first, booked):
+    days = day_grid("2025-01-01", "2025-03-31")
+    flows, var = np.zeros(len(days)), np.zeros(len(days))
+    months = np.arange(np.datetime64("2025-01"), np.datetime64("2025-04"))
+    total = app.add_monthly(flows, var, days, months, np.array([10]), np.array([50.0]), np.array([4.0]), np.array([skip_first]))
+    assert total == booked
+    assert flows[days == np.datetime64("2025-02-10")].tolist() == [50]
+    assert flows.sum() == booked and var.sum() == booked / 50 * 4
+
+
+def income_rows(description, months, amount=100, day=5):
+    return [{"_id": {"description": description, "month": m}, "amount": amount, "day": day} for m in months]
+
+
+def test_recurring_incomes():
+    hist_start, current = np.datetime64("2024-07", "M"), np.datetime64("2025-01", "M")
+    rows = (income_rows("salary", ["2024-08", "2024-09", "2024-10", "2024-11", "2024-12", "2025-01"])
+            + income_rows("bonus", ["2024-10", "2024-12"])
+            + income_rows("old job", ["2024-07", "2024-08", "2024-09"]))
+    names, mean, day, expected, variance, received = app.recurring_incomes(rows, hist_start, current)
+    assert names == ["salary"]
+    assert mean.tolist() == [100] and expected.tolist() == [100] and variance.tolist() == [0]
+    assert day.tolist() == [5] and received.tolist() == [True]
+
+
+def test_recurring_incomes_expects_less_of_irregular_payments():
+    hist_start, current = np.datetime64("2024-07", "M"), np.datetime64("2025-01", "M")
+    rows = income_rows("freelance", ["2024-07", "2024-09", "2024-11", "2024-12"])
+    names, _, _, expected, variance, received = app.recurring_incomes(rows, hist_start, current)
+    assert names == ["freelance"] and received.tolist() == [False]
+    assert expected[0] == pytest.approx(100 * 4 / 6)
+    assert variance[0] > 0
+
+
+def test_recurring_incomes_without_history():
+    names, mean, *_ = app.recurring_incomes([], np.datetime64("2024-07", "M"), np.datetime64("2025-01", "M"))
+    assert names == [] and len(mean) == 0
+
+
+def test_contribution_trend():
+    hist_start, current = np.datetime64("2024-10", "M"), np.datetime64("2025-01", "M")
+    assert app.contribution_trend([], hist_start, current, np.arange(3)) is None
+    rows = [{"_id": m, "net": 100, "day": 10} for m in ["2024-10", "2024-11", "2024-12"]]
+    trend, variance, day, made_this_month = app.contribution_trend(rows, hist_start, current, np.arange(3))
+    assert trend.tolist() == pytest.approx([100, 100, 100])
+    assert variance == pytest.approx(0) and day == 10 and made_this_month is False
+
+
+def test_contribution_trend_is_clamped_to_history():
+    hist_start, current = np.datetime64("2024-10", "M"), np.datetime64("2025-01", "M")
+    rows = [{"_id": m, "net": net, "day": 1} for m, net in [("2024-10", 0), ("2024-11", 100), ("2024-12", 200), ("2025-01", 50)]]
+    trend, _, _, made_this_month = app.contribution_trend(rows, hist_start, current, np.arange(12))
+    assert trend.max() == 200 and made_this_month is True
+
+
+@pytest.mark.parametrize("closing_day, due_day", [(5, 12), (28, 5), (31, 10), (10, 10), (30, None)])
+def test_pending_invoices_match_invoice_due_date(closing_day, due_day):
+    card = {"_id": "card", "closing_day": closing_day, "due_day": due_day}
+    days = day_grid("2024-12-01", "2025-08-01")
+    for offset in range(0, 120, 3):
+        purchase = datetime(2025, 1, 1) + timedelta(days=offset)
+        month = purchase.strftime("%Y-%m")
+        if purchase > app.invoice_period(card, month)[1]:
+            month = (purchase.replace(day=1) + timedelta(days=32)).strftime("%Y-%m")
+        expected = app.invoice_due_date(card, app.invoice_period(card, month)[1])
+
+        flows = np.zeros(len(days))
+        charges = [{"card_id": "card", "date": purchase.strftime("%Y-%m-%d"), "amount": 10}]
+        assert app.pending_invoices(flows, days, [card], charges) == 10
+        assert days[flows.nonzero()[0]].astype(str).tolist() == [expected.strftime("%Y-%m-%d")], purchase
+
+
+def test_pending_invoices_skips_unknown_cards_and_past_due_dates():
+    days = day_grid("2025-03-01", "2025-06-01")
+    cards = [{"_id": "card", "closing_day": 5, "due_day": 12}]
+    charges = [{"card_id": "other", "date": "2025-03-02", "amount": 10},
+               {"card_id": "card", "date": "2025-01-02", "amount": 20},
+               {"card_id": "card", "date": "2025-03-02", "amount": 30}]
+    flows = np.zeros(len(days))
+    assert app.pending_invoices(flows, days, cards, charges) == 30
+    assert flows.sum() == -30
+    assert app.pending_invoices(flows, days, [], charges) == 0
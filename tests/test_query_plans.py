@@ -0,0 +1,52 @@
+"""Every query the read routes send must be served by an index.
+
+Needs a MongoDB server: set MONGO_TEST_URI (default mongodb://localhost:27017/finscope_test).
+The database named in the URI is dropped before and after the run.
+"""
+from datetime import datetime
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from conftest import MONGO_TEST_URI
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    try:
+        MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=2000).admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"MongoDB is not reachable at {MONGO_TEST_URI}")
+    import app
+    app.client.drop_database(app.db.name)
+    app.ensure_indexes()
+    yield app
+    app.client.drop_database(app.db.name)
+
+
+@pytest.fixture(scope="module")
+def user_id(app_module):
+    # One row of everything, so no route stops early on an empty result.
+    db = app_module.db
+    today = datetime.now().strftime('%Y-%m-%d')
+    user_id = db.users.insert_one({"username": "plans", "password_hash": "", "created_at": datetime.utcnow()}).inserted_id
+    card_id = db.credit_cards.insert_one({"user_id": user_id, "name": "Card", "closing_day": 5, "due_day": 12}).inserted_id
+    db.incomes.insert_one(app_module.income_doc(user_id, {"description": "Salary", "amount": 100, "date": today}))
+    db.macro_expenses.insert_one(app_module.macro_expense_doc(user_id, {"description": "Rent", "amount": 50, "date": today}))
+    db.expenses.insert_one(app_module.expense_doc(user_id, {"description": "Probe", "amount": 5, "date": today, "card_id": str(card_id)}))
+    plan = app_module.installment_plan_doc(user_id, {"description": "TV", "amount": 10, "date": today, "card_id": str(card_id)}, 1, 3)
+    db.installment_plans.insert_one(plan)
+    db.wallets.insert_one(app_module.wallet_doc(user_id, {"name": "Bank", "balance": 10}))
+    investment_id = db.investments.insert_one({"user_id": user_id, "name": "Fund", "type": "fixed", "current_amount": 10}).inserted_id
+    db.investment_entries.insert_one({"user_id": user_id, "investment_id": investment_id, "type": "contribution", "amount": 10,
+                                      "date": today, "date_dt": app_module.to_date(today)})
+    return user_id
+
+
+def test_read_routes_use_indexes(app_module, user_id):
+    assert app_module.check_query_plans(user_id) == []
+
+
+def test_empty_user_routes_use_indexes(app_module):
+    assert app_module.check_query_plans() == []
@@ -0,0 +1,177 @@
+"""Bank statement parsing (CSV/OFX rows, amounts, dates); no database needed."""
+import io
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("value, expected", [
+    (12, 12.0),
+    (-3.5, -3.5),
+    ("12,5", 12.5),
+    ("12.50", 12.5),
+    ("+5", 5.0),
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("1.234,5", 1234.5),
+    ("1.234.567", 1234567.0),
+    ("1,234,567", 1234567.0),
+    ("0,123", 0.123),
+    ("1234.567", 1234.567),
+    ("1.2345", 1.2345),
+    ("R$ 1.234,56", 1234.56),
+    ("R$ -1.234,56", -1234.56),
+    ("1 234,56", 1234.56),
+])
+def test_parse_statement_amount(value, expected):
+    assert app.parse_statement_amount(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1.234", "1,234", "-1.234", "+999,000", "R$ 1.234"])
+def test_ambiguous_amount_needs_decimal_separator(value):
+    with pytest.raises(ValueError, match="ambiguous"):
+        app.parse_statement_amount(value)
+
+
+@pytest.mark.parametrize("value, decimal, expected", [
+    ("1.234", ",", 1234.0),
+    ("1.234", ".", 1.234),
+    ("1,234", ",", 1.234),
+    ("1,234", ".", 1234.0),
+    ("-1.234,56", ",", -1234.56),
+])
+def test_explicit_decimal_separator(value, decimal, expected):
+    assert app.parse_statement_amount(value, decimal) == expected
+
+
+@pytest.mark.parametrize("value, decimal", [
+    ("1.234.56", None),
+    ("1,23,45", None),
+    ("abc", None),
+    ("", None),
+    ("1,", None),
+    ("1.234,56", "."),
+    ("12,34.5", None),
+])
+def test_invalid_amount(value, decimal):
+    with pytest.raises(ValueError, match="invalid amount"):
+        app.parse_statement_amount(value, decimal)
+
+
+@pytest.mark.parametrize("amount, sign, expected", [
+    (-5, "bank", "debit"),
+    (5, "bank", "credit"),
+    (-5, "card", "credit"),
+    (5, "card", "debit"),
+    (0, "bank", None),
+])
+def test_amount_direction(amount, sign, expected):
+    assert app.amount_direction(amount, sign) == expected
+
+
+@pytest.mark.parametrize("value", ["2025-02-01", "01/02/2025", "20250201", "20250201120000[-3:BRT]", "2025-02-01T10:00:00"])
+def test_parse_statement_date(value):
+    assert app.parse_statement_date(value) == "2025-02-01"
+
+
+@pytest.mark.parametrize("value", ["", "2025-13-01", "32/01/2025", "Feb 1 2025"])
+def test_invalid_statement_date(value):
+    with pytest.raises(ValueError, match="invalid date"):
+        app.parse_statement_date(value)
+
+
+def test_statement_row_data():
+    row = {"date": "01/02/2025", "amount": "-1.234,56", "description": " Padaria ", "installments": "Parcela 2 / 10"}
+    data = app.statement_row_data("expenses", row, {})
+    assert data["description"] == "Padaria" and data["amount"] == 1234.56 and data["date"] == "2025-02-01"
+    assert data["installments"] == "2/10" and data["payment_method"] == "debit" and data["card_id"] is None
+    assert app.statement_row_data("incomes", {**row, "amount": "1.234,56"}, {})["amount"] == 1234.56
+
+
+def test_statement_row_direction_follows_sign_convention():
+    charge = {"date": "2025-02-01", "amount": "45,90", "description": "Market"}
+    with pytest.raises(ValueError, match="credit entry"):
+        app.statement_row_data("expenses", charge, {})
+    assert app.statement_row_data("expenses", charge, {}, sign="card")["amount"] == 45.9
+    with pytest.raises(ValueError, match="debit entry"):
+        app.statement_row_data("incomes", charge, {}, sign="card")
+    # An explicit direction (OFX) wins over the sign.
+    assert app.statement_row_data("expenses", {**charge, "direction": "debit"}, {})["amount"] == 45.9
+
+
+def test_statement_row_cards():
+    cards = {"nubank": "card-1"}
+    row = {"date": "2025-02-01", "amount": "-10", "description": "Bus"}
+    assert app.statement_row_data("expenses", {**row, "card": "Nubank"}, cards)["card_id"] == "card-1"
+    assert app.statement_row_data("expenses", row, cards, default_card_id="card-2")["payment_method"] == "credit"
+    with pytest.raises(ValueError, match="unknown card"):
+        app.statement_row_data("expenses", {**row, "card": "Other"}, cards)
+
+
+@pytest.mark.parametrize("row, message", [
+    ({"amount": "-1", "description": "x"}, "missing date"),
+    ({"date": "2025-02-01", "amount": "", "description": "x"}, "missing amount"),
+    ({"date": "2025-02-01", "amount": "-1", "description": "  "}, "missing description"),
+    ({"date": "2025-02-01", "amount": "-1.234", "description": "x"}, "ambiguous"),
+])
+def test_statement_row_errors(row, message):
+    with pytest.raises(ValueError, match=message):
+        app.statement_row_data("expenses", row, {})
+
+
+def test_csv_records_with_mapping():
+    stream = io.StringIO("Data;Valor;Historico\n01/02/2025;-12,50;Padaria\n02/02/2025;-3,00;Cafe\n")
+    rows = list(app.csv_records(stream, {"date": "Data", "amount": "Valor", "description": "Historico"}))
+    assert [line for line, _ in rows] == [2, 3]
+    assert rows[0][1]["date"] == "01/02/2025" and rows[0][1]["amount"] == "-12,50" and rows[0][1]["description"] == "Padaria"
+
+
+def test_csv_records_normalizes_headers():
+    rows = list(app.csv_records(io.StringIO(" Date ,Amount,Description\n2025-02-01,-1.50,Bus\n")))
+    assert rows == [(2, {"date": "2025-02-01", "amount": "-1.50", "description": "Bus"})]
+
+
+def test_csv_records_empty_input():
+    assert list(app.csv_records(io.StringIO(""))) == []
+
+
+def test_csv_records_rejects_unknown_delimiter():
+    with pytest.raises(ValueError, match="delimiter"):
+        app.csv_records(io.StringIO("date|amount|description\n2025-02-01|-1|Bus\n"))
+
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20250201120000[-3:BRT]
+<TRNAMT>-12.50
+<FITID>1001
+<NAME>PADARIA
+<MEMO>Compra padaria
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250205<TRNAMT>1500,00<FITID>1002<NAME>SALARIO</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+def test_ofx_records():
+    records = list(app.ofx_records(io.StringIO(OFX)))
+    assert records == [
+        (1, {"date": "20250201120000[-3:BRT]", "amount": 12.5, "direction": "debit", "description": "Compra padaria",
+             "establishment": "PADARIA", "fitid": "1001"}),
+        (2, {"date": "20250205", "amount": 1500.0, "direction": "credit", "description": "SALARIO",
+             "establishment": "SALARIO", "fitid": "1002"}),
+    ]
+    assert app.statement_row_data("incomes", records[1][1], {})["date"] == "2025-02-05"
+
+
+@pytest.mark.parametrize("raw", ["", "not json", "[]", '{"date": 1}', '"date"'])
+def test_parse_mapping_errors(raw):
+    with pytest.raises(ValueError, match="Mapping"):
+        app.parse_mapping(raw)
+
+
+def test_parse_mapping():
+    assert app.parse_mapping('{"date": "Data"}') == {"date": "Data"}